@@ -1,109 +1,570 @@
+import asyncio
+import contextvars
+import importlib
+import json
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from anthropic import Anthropic, AnthropicError
-from openai import OpenAI
-from tavily import TavilyClient
-from utils import print_colored, CLAUDE_COLOR, GPT_COLOR
-from file_operations import create_folder, create_file, write_to_file, list_files
+from types import SimpleNamespace
+from utils import print_colored, CLAUDE_COLOR, GPT_COLOR, TOOL_COLOR
+from api_client import (load_config, call_with_retries, acall_with_retries, is_retryable, backoff_delay,
+                        get_rate_limiter, get_http_client)
+from context_window import ContextWindow, estimate_tokens
+from tools import execute_tool, run_tool_calls
+from response_cache import request_key
+from instrumentation import span, add
+
+def estimate_request_tokens(params):
+    return estimate_tokens(json.dumps([params.get("system"), params["messages"], params.get("tools")], default=str))
+
+class ModelError(Exception):
+    """A model request failed after retries; raised instead of a fallback reply when raise_errors is set."""
 
 class AIModel(ABC):
+    label = "AI"
+    color = CLAUDE_COLOR
+    sdk = None  # Provider SDK module, imported only when the model is first built
+    last_error = None  # The provider error behind the most recent None response
+
     @abstractmethod
     def chat(self, messages, system_prompt, tools):
         pass
 
+    async def achat(self, messages, system_prompt, tools):
+        return await asyncio.to_thread(self.chat, messages, system_prompt, tools)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+# Message key (stripped before sending) counting trailing blocks that are sent this once and not kept in history
+UNCACHED_BLOCKS = "uncached_blocks"
+
+def api_message(message):
+    return {key: value for key, value in message.items() if key != UNCACHED_BLOCKS}
+
+def with_cache_breakpoint(message):
+    """Copy a message with a prompt-cache breakpoint on its last content block that history will repeat."""
+    content = message["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    blocks = [block if isinstance(block, dict) else block.model_dump(exclude_none=True) for block in content]
+    index = max(len(blocks) - 1 - message.get(UNCACHED_BLOCKS, 0), 0)
+    blocks[index] = {**blocks[index], "cache_control": CACHE_CONTROL}
+    return {**api_message(message), "content": blocks}
+
 class ClaudeModel(AIModel):
+    label = "Claude"
+    color = CLAUDE_COLOR
+    model = "claude-3-opus-20240229"
+    sdk = "anthropic"
+
     def __init__(self):
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
+        anthropic = importlib.import_module(self.sdk)
+        self.error = anthropic.AnthropicError
         print(f"Initializing Anthropic client with API Key: {api_key[:10]}...{api_key[-5:]}")
-        self.client = Anthropic(api_key=api_key)
+        # Retries are handled by api_client so backoff and rate limits are shared across models
+        self.config = load_config()
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0, timeout=self.config["timeout"],
+                                http_client=get_http_client(anthropic))
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0, timeout=self.config["timeout"],
+                                           http_client=get_http_client(anthropic, asynchronous=True))
+        self.limiter = get_rate_limiter("anthropic")
         print("Anthropic client initialized successfully")
-        self.tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+    def _build_params(self, messages, system_prompt, tools):
+        # Cache breakpoints go on the tools, the system prompt and the end of the conversation,
+        # so every request after the first reuses the prefix written by the one before it
+        if messages:
+            messages = [api_message(message) for message in messages[:-1]] + [with_cache_breakpoint(messages[-1])]
+        params = {
+            "model": self.model,
+            "max_tokens": 4000,
+            "messages": messages,
+        }
+        if system_prompt:
+            params["system"] = [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+        if tools:
+            params["tools"] = tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+            params["tool_choice"] = {"type": "auto"}
+        return params
 
     def chat(self, messages, system_prompt, tools):
+        self.last_error = None
         try:
-            params = {
-                "model": "claude-3-opus-20240229",
-                "max_tokens": 4000,
-                "messages": messages,
-            }
-            if system_prompt:
-                params["system"] = system_prompt
-            if tools:
-                params["tools"] = tools
-                params["tool_choice"] = {"type": "auto"}
-
-            response = self.client.messages.create(**params)
+            params = self._build_params(messages, system_prompt, tools)
+            response = call_with_retries(self.client.messages.create, limiter=self.limiter,
+                                         tokens=estimate_request_tokens(params), config=self.config, **params)
             return response
-        except AnthropicError as e:
+        except self.error as e:
             print(f"AnthropicError: {str(e)}")
+            self.last_error = e
             return None
 
+    async def achat(self, messages, system_prompt, tools):
+        self.last_error = None
+        try:
+            params = self._build_params(messages, system_prompt, tools)
+            return await acall_with_retries(self.async_client.messages.create, limiter=self.limiter,
+                                            tokens=estimate_request_tokens(params), config=self.config, **params)
+        except self.error as e:
+            print(f"AnthropicError: {str(e)}")
+            self.last_error = e
+            return None
+
+    def stream_chat(self, messages, system_prompt, tools):
+        """Yield ("text", delta) and ("tool_use", block) events as they arrive, then ("message", response)."""
+        self.last_error = None
+        params = self._build_params(messages, system_prompt, tools)
+        tokens = estimate_request_tokens(params)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                self.limiter.acquire(tokens)
+                with self.client.messages.stream(**params) as stream:
+                    for event in stream:
+                        if event.type == "text":
+                            started = True
+                            yield "text", event.text
+                        elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                            started = True
+                            yield "tool_use", event.content_block
+                    yield "message", stream.get_final_message()
+                return
+            except self.error as e:
+                # Output already shown to the user can't be taken back, so only retry before the first event
+                if started or attempt >= self.config["max_retries"] or not is_retryable(e):
+                    print(f"AnthropicError: {str(e)}")
+                    self.last_error = e
+                    return
+                time.sleep(backoff_delay(attempt, e, self.config))
+                attempt += 1
+
+def to_openai_messages(messages, system_prompt):
+    """Convert Anthropic-style messages (with tool_use/tool_result blocks) to chat completions format."""
+    converted = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            converted.append({"role": message["role"], "content": content})
+            continue
+        blocks = [block if isinstance(block, dict) else block.model_dump(exclude_none=True) for block in content]
+        text = "".join(block.get("text", "") for block in blocks if block.get("type") == "text")
+        if message["role"] == "assistant":
+            entry = {"role": "assistant", "content": text or None}
+            tool_calls = [{"id": block["id"], "type": "function",
+                           "function": {"name": block["name"], "arguments": json.dumps(block["input"])}}
+                          for block in blocks if block.get("type") == "tool_use"]
+            if tool_calls:
+                entry["tool_calls"] = tool_calls
+            converted.append(entry)
+            continue
+        for block in blocks:
+            if block.get("type") == "tool_result":
+                converted.append({"role": "tool", "tool_call_id": block["tool_use_id"],
+                                  "content": str(block.get("content", ""))})
+        if text:
+            converted.append({"role": "user", "content": text})
+    return converted
+
+def to_openai_tools(tools):
+    return [{"type": "function",
+             "function": {"name": tool["name"], "description": tool.get("description", ""),
+                          "parameters": tool.get("input_schema", {"type": "object", "properties": {}})}}
+            for tool in tools]
+
+def from_openai_response(response):
+    """Shape a chat completion like an Anthropic message so the tool loop can treat both alike."""
+    choice = response.choices[0]
+    content = []
+    if choice.message.content:
+        content.append(SimpleNamespace(type="text", text=choice.message.content))
+    for call in choice.message.tool_calls or []:
+        try:
+            arguments = json.loads(call.function.arguments or "{}")
+        except ValueError:
+            arguments = {}
+        content.append(SimpleNamespace(type="tool_use", id=call.id, name=call.function.name, input=arguments))
+    usage = response.usage
+    details = getattr(usage, "prompt_tokens_details", None)
+    return SimpleNamespace(
+        content=content,
+        stop_reason="tool_use" if choice.finish_reason == "tool_calls" else "end_turn",
+        usage=SimpleNamespace(input_tokens=getattr(usage, "prompt_tokens", 0),
+                              output_tokens=getattr(usage, "completion_tokens", 0),
+                              cache_read_input_tokens=getattr(details, "cached_tokens", 0) or 0,
+                              cache_creation_input_tokens=0),
+    )
+
 class GPT4Model(AIModel):
+    label = "GPT-4"
+    color = GPT_COLOR
+    model = "gpt-4o"
+    sdk = "openai"
+
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+        api_key = os.getenv("OPENAI_API_KEY")
+        openai = importlib.import_module(self.sdk)
+        self.error = openai.OpenAIError
+        self.config = load_config()
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0, timeout=self.config["timeout"],
+                             http_client=get_http_client(openai))
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, max_retries=0, timeout=self.config["timeout"],
+                                        http_client=get_http_client(openai, asynchronous=True))
+        self.limiter = get_rate_limiter("openai")
+
+    def _build_params(self, messages, system_prompt, tools):
+        params = {
+            "model": self.model,
+            "max_tokens": 4000,
+            "messages": to_openai_messages(messages, system_prompt),
+        }
+        if tools:
+            params["tools"] = to_openai_tools(tools)
+            params["tool_choice"] = "auto"
+        return params
 
     def chat(self, messages, system_prompt, tools):
-        # Implement GPT-4 chat method
-        # Note: This is a placeholder and needs to be implemented based on OpenAI's API
-        pass
+        self.last_error = None
+        try:
+            params = self._build_params(messages, system_prompt, tools)
+            response = call_with_retries(self.client.chat.completions.create, limiter=self.limiter,
+                                         tokens=estimate_request_tokens(params), config=self.config, **params)
+            return from_openai_response(response)
+        except self.error as e:
+            print(f"OpenAIError: {str(e)}")
+            self.last_error = e
+            return None
+
+    async def achat(self, messages, system_prompt, tools):
+        self.last_error = None
+        try:
+            params = self._build_params(messages, system_prompt, tools)
+            response = await acall_with_retries(self.async_client.chat.completions.create, limiter=self.limiter,
+                                                tokens=estimate_request_tokens(params), config=self.config, **params)
+            return from_openai_response(response)
+        except self.error as e:
+            print(f"OpenAIError: {str(e)}")
+            self.last_error = e
+            return None
+
+MODEL_CLASSES = {"claude": ClaudeModel, "gpt4": GPT4Model}
+
+def preload_sdk(model_name):
+    """Start importing a model's SDK in the background so it is loaded by the first request."""
+    model_class = MODEL_CLASSES.get(model_name)
+    if model_class and model_class.sdk:
+        threading.Thread(target=importlib.import_module, args=(model_class.sdk,), daemon=True).start()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def background_loop():
+    """Process-wide event loop for async clients, whose pooled connections are bound to one loop."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+        return _loop
+
+async def _in_context(coroutine, context):
+    """Await coroutine as a task created in context, which it and the tasks it spawns then share."""
+    return await context.run(asyncio.ensure_future, coroutine)
 
 class AIInterface:
-    def __init__(self, model_name):
-        self.model = self._get_model(model_name)
+    def __init__(self, model_name, stream=True, context_window=None, max_tool_iterations=10, fan_out_models=None,
+                 response_cache=None, context_provider=None, raise_errors=False):
+        if model_name not in MODEL_CLASSES:
+            raise ValueError(f"Unsupported model: {model_name}")
+        self.models = {}
+        self.models_lock = threading.Lock()
+        # The model, and with it the provider SDK, is built on first use rather than at startup
+        self.model_name = model_name
+        self.fan_out_models = fan_out_models or []
+        self.max_tool_iterations = max_tool_iterations
+        self.stream = stream
+        self.context_window = context_window or ContextWindow()
+        # Opt-in replay of identical requests; see response_cache.py
+        self.response_cache = response_cache
+        # Optional callable returning extra context for a request, e.g. dependency_graph.RelatedContext
+        self.context_provider = context_provider
+        # Batch callers need failures as exceptions; the interactive CLI shows an apology instead
+        self.raise_errors = raise_errors
+        self.last_rendered = False
+        self.turn_usage = None  # Summed over every response of the current user turn
+        self.usage_totals = {"input_tokens": 0, "output_tokens": 0,
+                             "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
 
     def _get_model(self, model_name):
-        if model_name == "claude":
-            return ClaudeModel()
-        elif model_name == "gpt4":
-            return GPT4Model()
-        else:
-            raise ValueError(f"Unsupported model: {model_name}")
+        # Models (and their HTTP clients) are built once and reused across switches
+        with self.models_lock:
+            if model_name not in self.models:
+                if model_name not in MODEL_CLASSES:
+                    raise ValueError(f"Unsupported model: {model_name}")
+                self.models[model_name] = MODEL_CLASSES[model_name]()
+            return self.models[model_name]
+
+    @property
+    def model(self):
+        return self._get_model(self.model_name)
+
+    def switch_model(self, model_name):
+        self._get_model(model_name)
+        self.model_name = model_name
 
     def chat(self, user_input, conversation_history, system_prompt, tools):
+        with span("chat", model=self.model_name) as chat:
+            self.turn_usage = None
+            result = self._chat(user_input, conversation_history, system_prompt, tools)
+            stats = self.context_window.stats
+            chat.set(request_tokens=stats["last_request_tokens"], messages_summarized=stats["messages_summarized"],
+                     messages_dropped=stats["messages_dropped"])
+            add("request_tokens_sent", stats["last_request_tokens"])
+            return result
+
+    def _chat(self, user_input, conversation_history, system_prompt, tools):
         # Filter out any empty messages from the conversation history
         filtered_history = [msg for msg in conversation_history if msg.get('content')]
 
-        # Add the new user input
+        # Add the new user input, then trim older turns to fit the token budget
         messages = filtered_history + [{"role": "user", "content": user_input}]
+        messages = self.with_related_context(self.context_window.build(messages, system_prompt, tools), user_input)
 
-        response = self.model.chat(messages, system_prompt, tools)
+        self.last_rendered = False
+        if self.fan_out_models:
+            return self._run_async(self.achat_messages(messages, system_prompt, tools, self.fan_out_models))
 
-        if response is None:
-            return "Sorry, there was an error processing your request."
+        # Agentic loop: run every tool_use block from a response, send all results back
+        # in one follow-up message, and repeat until the model stops asking for tools
+        result = ""
+        for _ in range(self.max_tool_iterations):
+            response, streamed = self._request(messages, system_prompt, tools)
+            if response is None:
+                return self._failed(result, [self.model])
+            self.record_usage(response)
+            text, tool_uses = self.process_claude_response(response, streamed=streamed)
+            result += "\n" + text if result and text else text
+            if response.stop_reason != "tool_use" or not tool_uses:
+                return result
+            messages = messages + self._tool_round(response, self.run_tools(tool_uses))
+        return result + f"\n[Stopped after {self.max_tool_iterations} rounds of tool calls]"
 
-        # Process and return the response
-        if isinstance(self.model, ClaudeModel):
-            return self.process_claude_response(response)
-        elif isinstance(self.model, GPT4Model):
-            # Handle GPT-4's response format (placeholder)
-            return response
+    def _failed(self, result, models):
+        """The reply for a request that got no response, or a ModelError when raise_errors is set."""
+        if self.raise_errors:
+            errors = [f"{type(model.last_error).__name__}: {model.last_error}" for model in models
+                      if model.last_error is not None]
+            raise ModelError("; ".join(errors) or "The model request failed")
+        return result + "Sorry, there was an error processing your request."
+
+    def with_related_context(self, messages, user_input):
+        """Append context about related files to the new user message, after the user's text.
+
+        History stores only the user's text, so the context block is marked UNCACHED_BLOCKS:
+        the cache breakpoint goes on the text before it, and the prefix cached by this request
+        is exactly what the next request repeats.
+        """
+        if not self.context_provider:
+            return messages
+        with span("related_context") as related:
+            context = self.context_provider(user_input)
+            related.set(chars=len(context))
+        if not context:
+            return messages
+        content = [{"type": "text", "text": user_input}, {"type": "text", "text": "\n\n" + context}]
+        return messages[:-1] + [{"role": "user", "content": content, UNCACHED_BLOCKS: 1}]
+
+    def _tool_round(self, response, tool_results):
+        return [
+            {"role": "assistant", "content": [self._block_to_dict(block) for block in response.content]},
+            {"role": "user", "content": tool_results},
+        ]
+
+    def _run_async(self, coroutine):
+        # The loop's thread has its own context; the caller's daemon channel, session and span go along
+        return asyncio.run_coroutine_threadsafe(_in_context(coroutine, contextvars.copy_context()),
+                                                background_loop()).result()
+
+    async def achat(self, user_input, conversation_history, system_prompt, tools, model_names=None, mode="first"):
+        """Async chat; with several model_names the first request fans out to all of them."""
+        self.turn_usage = None
+        filtered_history = [msg for msg in conversation_history if msg.get('content')]
+        messages = filtered_history + [{"role": "user", "content": user_input}]
+        messages = self.with_related_context(self.context_window.build(messages, system_prompt, tools), user_input)
+        return await self.achat_messages(messages, system_prompt, tools, model_names, mode)
+
+    async def achat_messages(self, messages, system_prompt, tools, model_names=None, mode="first"):
+        model_names = model_names or [self.model_name]
+        if len(model_names) == 1:
+            # A single model is deterministic enough to replay; a race between several is not
+            model = self._get_model(model_names[0])
+            response = await self._cached_achat(model, messages, system_prompt, tools)
         else:
-            return str(response)  # Fallback for unknown model types
+            model, response = await self.race(messages, system_prompt, tools, model_names, mode)
+        # Only the winning model continues the tool loop, so tools never run twice
+        result = ""
+        for _ in range(self.max_tool_iterations):
+            if response is None:
+                return self._failed(result, [self._get_model(name) for name in model_names])
+            self.record_usage(response)
+            text, tool_uses = self.process_claude_response(response, model=model)
+            result += "\n" + text if result and text else text
+            if response.stop_reason != "tool_use" or not tool_uses:
+                return result
+            tool_results = await asyncio.to_thread(self.run_tools, tool_uses)
+            messages = messages + self._tool_round(response, tool_results)
+            response = await self._cached_achat(model, messages, system_prompt, tools)
+        return result + f"\n[Stopped after {self.max_tool_iterations} rounds of tool calls]"
+
+    async def race(self, messages, system_prompt, tools, model_names, mode="first", scorer=None):
+        """Send the same request to several models concurrently.
 
-    def process_claude_response(self, response):
+        mode="first" returns the first successful response and cancels the rest; mode="best"
+        waits for all of them and returns the highest scoring (longest text by default).
+        """
+        models = [self._get_model(name) for name in model_names]
+        if len(models) == 1:
+            return models[0], await models[0].achat(messages, system_prompt, tools)
+        tasks = {asyncio.ensure_future(model.achat(messages, system_prompt, tools)): model for model in models}
+        pending = set(tasks)
+        finished = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result() is not None:
+                        finished.append((tasks[task], task.result()))
+                if finished and mode == "first":
+                    return finished[0]
+        finally:
+            for task in pending:
+                task.cancel()
+        if not finished:
+            return models[0], None
+        scorer = scorer or (lambda response: sum(len(getattr(block, "text", "") or "") for block in response.content))
+        return max(finished, key=lambda pair: scorer(pair[1]))
+
+    def _request(self, messages, system_prompt, tools):
+        """Return the response and whether it was already printed while streaming."""
+        with span("model.request", model=self.model_name, messages=len(messages)) as request:
+            key = None
+            if self.response_cache:
+                key = request_key(self.model.model, messages, system_prompt, tools)
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    add("response_cache_hits", 1)
+                    request.set(cached=True)
+                    return cached, False
+            if self.stream and hasattr(self.model, "stream_chat"):
+                response, streamed = self.render_stream(self.model.stream_chat(messages, system_prompt, tools)), True
+            else:
+                response, streamed = self.model.chat(messages, system_prompt, tools), False
+            if key and response is not None:
+                self.response_cache.put(key, response)
+            request.set(streamed=streamed, failed=response is None)
+            return response, streamed
+
+    async def _cached_achat(self, model, messages, system_prompt, tools):
+        with span("model.request", model=model.label, messages=len(messages)) as request:
+            if not self.response_cache:
+                return await model.achat(messages, system_prompt, tools)
+            key = request_key(model.model, messages, system_prompt, tools)
+            response = await asyncio.to_thread(self.response_cache.get, key)
+            if response is not None:
+                add("response_cache_hits", 1)
+                request.set(cached=True)
+                return response
+            response = await model.achat(messages, system_prompt, tools)
+            if response is not None:
+                await asyncio.to_thread(self.response_cache.put, key, response)
+            return response
+
+    @staticmethod
+    def _block_to_dict(block):
+        if block.type == "text":
+            return {"type": "text", "text": block.text}
+        if block.type == "tool_use":
+            return {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+        if hasattr(block, "model_dump"):
+            return block.model_dump(exclude_none=True)
+        return dict(vars(block))
+
+    def run_tools(self, tool_uses):
+        """Execute tool_use blocks concurrently and return the matching tool_result blocks."""
+        results = run_tool_calls([(block.id, block.name, block.input) for block in tool_uses])
+        if hasattr(self.context_provider, "note_paths"):
+            self.context_provider.note_paths([block.input["path"] for block in tool_uses
+                                              if isinstance(block.input, dict) and block.input.get("path")])
+        tool_results = []
+        for (tool_use_id, output, is_error), block in zip(results, tool_uses):
+            shown = output if len(output) <= 1000 else output[:1000] + "... [truncated]"
+            print_colored(f"\nTool result ({block.name}): {shown}", TOOL_COLOR)
+            tool_result = {"type": "tool_result", "tool_use_id": tool_use_id, "content": output}
+            if is_error:
+                tool_result["is_error"] = True
+            tool_results.append(tool_result)
+        return tool_results
+
+    def record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        if self.turn_usage is None:
+            self.turn_usage = dict.fromkeys(self.usage_totals, 0)
+        for key in self.usage_totals:
+            value = getattr(usage, key, None) or 0
+            self.turn_usage[key] += value
+            self.usage_totals[key] += value
+            add(key, value)
+
+    def usage_summary(self):
+        """One-line token report for the last turn, all tool rounds included, with prompt-cache reads and writes."""
+        if not self.turn_usage:
+            return ""
+        u = self.turn_usage
+        summary = (f"Tokens: {u['input_tokens']} in, {u['output_tokens']} out, "
+                   f"{u['cache_read_input_tokens']} cache read, {u['cache_creation_input_tokens']} cache write")
+        if self.response_cache:
+            summary += "\n" + self.response_cache.summary()
+        return summary
+
+    def render_stream(self, events):
+        """Print text deltas as they arrive and return the assembled final response."""
+        response = None
+        started = False
+        for kind, payload in events:
+            if kind == "text":
+                if not started:
+                    print_colored(f"\n{self.model.label}: ", self.model.color, end="")
+                    started = True
+                print_colored(payload, self.model.color, end="")
+            elif kind == "tool_use":
+                print_colored(f"\nTool call: {payload.name}", TOOL_COLOR)
+            elif kind == "message":
+                response = payload
+        if started:
+            print()
+        return response
+
+    def process_claude_response(self, response, streamed=False, model=None):
+        """Return the response text and its tool_use blocks, printing the text if it was not streamed."""
+        model = model or self.model
         result = ""
+        tool_uses = []
         for content_block in response.content:
             if content_block.type == "text":
                 result += content_block.text
-                print_colored(f"\nClaude: {content_block.text}", CLAUDE_COLOR)
-            elif content_block.type == "tool_calls":
-                for tool_call in content_block.tool_calls:
-                    tool_result = self.execute_tool(tool_call.function.name, tool_call.function.arguments)
-                    result += f"\nTool result: {tool_result}"
-                    print_colored(f"\nTool result: {tool_result}", CLAUDE_COLOR)
-        return result
+                if not streamed:
+                    print_colored(f"\n{model.label}: {content_block.text}", model.color)
+                self.last_rendered = True
+            elif content_block.type == "tool_use":
+                tool_uses.append(content_block)
+                if not streamed:
+                    print_colored(f"\nTool call: {content_block.name}", TOOL_COLOR)
+        return result, tool_uses
 
     def execute_tool(self, tool_name, tool_arguments):
-        if tool_name == "create_folder":
-            return create_folder(tool_arguments["path"])
-        elif tool_name == "create_file":
-            return create_file(tool_arguments["path"], tool_arguments.get("content", ""))
-        elif tool_name == "write_to_file":
-            return write_to_file(tool_arguments["path"], tool_arguments["content"])
-        elif tool_name == "list_files":
-            return list_files(tool_arguments.get("path", "."))
-        else:
-            return f"Unknown tool: {tool_name}"
\ No newline at end of file
+        return execute_tool(tool_name, tool_arguments)
@@ -0,0 +1,181 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout"}
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def load_config():
+    """Client settings, overridable through ASSISTANT_* environment variables."""
+    return {
+        "timeout": _env_float("ASSISTANT_API_TIMEOUT", 120.0),
+        "max_retries": int(_env_float("ASSISTANT_MAX_RETRIES", 5)),
+        "base_delay": _env_float("ASSISTANT_RETRY_BASE_DELAY", 1.0),
+        "max_delay": _env_float("ASSISTANT_RETRY_MAX_DELAY", 60.0),
+        "requests_per_minute": _env_float("ASSISTANT_REQUESTS_PER_MINUTE", 0),
+        "tokens_per_minute": _env_float("ASSISTANT_TOKENS_PER_MINUTE", 0),
+        "max_connections": int(_env_float("ASSISTANT_MAX_CONNECTIONS", 20)),
+    }
+
+class RateLimiter:
+    """Client-side token buckets for requests and tokens per minute; a limit of 0 disables it."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = dict(self.limits)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """Take capacity for one request and return how long the caller must wait for it."""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            wait = 0.0
+            for key, amount in (("requests", 1), ("tokens", tokens)):
+                limit = self.limits[key]
+                if not limit:
+                    continue
+                rate = limit / 60.0
+                self.available[key] = min(limit, self.available[key] + elapsed * rate)
+                # A single request larger than the bucket is let through once the bucket is full
+                amount = min(amount, limit)
+                self.available[key] -= amount
+                if self.available[key] < 0:
+                    wait = max(wait, -self.available[key] / rate)
+            return wait
+
+    def acquire(self, tokens=0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def status_code(error):
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+def is_retryable(error):
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None  # Neither seconds nor an HTTP date; fall back to backoff
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)  # HTTP dates are GMT, even written as "-0000"
+    return max((parsed - datetime.now(timezone.utc)).total_seconds(), 0)
+
+def backoff_delay(attempt, error, config):
+    """Honor retry-after when the server sends it, otherwise exponential backoff with full jitter."""
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, config["max_delay"])
+    return random.uniform(0, min(config["max_delay"], config["base_delay"] * 2 ** attempt))
+
+def call_with_retries(fn, *args, limiter=None, tokens=0, config=None, **kwargs):
+    config = config or load_config()
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(tokens)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= config["max_retries"] or not is_retryable(e):
+                raise
+            time.sleep(backoff_delay(attempt, e, config))
+            attempt += 1
+
+async def acall_with_retries(fn, *args, limiter=None, tokens=0, config=None, **kwargs):
+    config = config or load_config()
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.aacquire(tokens)
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= config["max_retries"] or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, e, config))
+            attempt += 1
+
+_shared = {}
+_shared_lock = threading.RLock()
+
+def _get_shared(key, factory):
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+def get_rate_limiter(provider):
+    config = load_config()
+    return _get_shared(("limiter", provider),
+                       lambda: RateLimiter(config["requests_per_minute"], config["tokens_per_minute"]))
+
+def _limits(sdk, config):
+    # Build the Limits type the SDK's own HTTP library expects
+    return type(sdk.DEFAULT_CONNECTION_LIMITS)(max_connections=config["max_connections"],
+                                                max_keepalive_connections=config["max_connections"])
+
+def get_http_client(sdk, asynchronous=False):
+    """One pooled keep-alive HTTP client per provider SDK, shared by every model instance."""
+    config = load_config()
+    factory = sdk.DefaultAsyncHttpxClient if asynchronous else sdk.DefaultHttpxClient
+    return _get_shared(("http", sdk.__name__, asynchronous),
+                       lambda: factory(timeout=config["timeout"], limits=_limits(sdk, config)))
+
+def get_requests_session():
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+        config = load_config()
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config["max_connections"])
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_shared(("requests",), create)
+
+def get_tavily_client():
+    def create():
+        from tavily import TavilyClient
+        return TavilyClient(api_key=os.getenv("TAVILY_API_KEY"), session=get_requests_session())
+    return _get_shared(("tavily",), create)
@@ -0,0 +1,272 @@
+import ast
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from utils import state_path, atomic_write
+
+# Below this many cache misses, parsing inline beats starting a process pool
+PARALLEL_THRESHOLD = 32
+# Changed entries analyze_file keeps in memory before writing them out
+SAVE_BATCH = 64
+# Bumped whenever analyze_source's output changes, so older cached entries are re-parsed
+ANALYSIS_VERSION = 2
+# Exceptions whose handler marks the imports in its try body as optional
+_IMPORT_ERRORS = {"ImportError", "ModuleNotFoundError"}
+
+class _Collector(ast.NodeVisitor):
+    """Gathers everything the analysis and docs features need in a single walk of the tree."""
+
+    def __init__(self):
+        self.functions = []
+        self.classes = []
+        self.imports = []
+        self.import_details = []
+        self.definitions = []
+        self.symbols = []
+        self.scope = []
+        self.guarded = 0  # Depth of enclosing try blocks that handle ImportError
+
+    def _visit_def(self, node, kind):
+        (self.classes if kind == "class" else self.functions).append(node.name)
+        qualname = ".".join(self.scope + [node.name])
+        self.symbols.append({"name": node.name, "qualname": qualname, "kind": kind,
+                             "lineno": node.lineno, "end_lineno": getattr(node, "end_lineno", node.lineno)})
+        if not self.scope:
+            entry = {"kind": kind, "name": node.name, "docstring": ast.get_docstring(node, clean=False),
+                     "lineno": node.lineno}
+            if kind == "class":
+                entry["bases"] = [ast.unparse(base) for base in node.bases]
+            else:
+                entry["args"] = [a.arg for a in node.args.args]
+            self.definitions.append(entry)
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self._visit_def(node, "function")
+
+    def visit_AsyncFunctionDef(self, node):
+        self._visit_def(node, "function")
+
+    def visit_ClassDef(self, node):
+        self._visit_def(node, "class")
+
+    def visit_Try(self, node):
+        caught = set()
+        for handler in node.handlers:
+            types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+            caught |= {"ImportError" if t is None else ast.unparse(t).split(".")[-1] for t in types}
+        guarded = bool(caught & _IMPORT_ERRORS)
+        self.guarded += guarded
+        for statement in node.body:
+            self.visit(statement)
+        self.guarded -= guarded
+        for child in node.handlers + node.orelse + node.finalbody:
+            self.visit(child)
+
+    visit_TryStar = visit_Try
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append(alias.name)
+            self.import_details.append({"module": alias.name, "names": [], "level": 0, "lineno": node.lineno,
+                                        "guarded": self.guarded > 0})
+
+    def visit_ImportFrom(self, node):
+        if node.module:
+            self.imports.append(node.module)
+        self.import_details.append({"module": node.module or "", "names": [alias.name for alias in node.names],
+                                    "level": node.level, "lineno": node.lineno, "guarded": self.guarded > 0})
+
+def analyze_source(content):
+    """Analyze Python source in one pass; syntax errors are reported instead of raised."""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError) as e:
+        return {"functions": [], "classes": [], "imports": [], "import_details": [], "definitions": [],
+                "symbols": [], "docstring": None, "error": f"{type(e).__name__}: {e}"}
+    collector = _Collector()
+    collector.visit(tree)
+    return {
+        "functions": collector.functions,
+        "classes": collector.classes,
+        "imports": collector.imports,
+        "import_details": collector.import_details,
+        "definitions": collector.definitions,
+        "symbols": collector.symbols,
+        "docstring": ast.get_docstring(tree, clean=False),
+        "error": None,
+    }
+
+def _read_and_analyze(path):
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    return path, stat.st_mtime_ns, stat.st_size, digest, analyze_source(data.decode("utf-8", errors="replace"))
+
+def _pool_context():
+    """Start method for parsing workers: never a plain fork, since this process already runs threads."""
+    try:
+        context = multiprocessing.get_context("forkserver")
+    except ValueError:
+        return multiprocessing.get_context("spawn")  # No forkserver on Windows
+    context.set_forkserver_preload([__name__])
+    return context
+
+class AnalysisCache:
+    """Per-file analysis results keyed by path, mtime, size and content hash, in memory and on disk.
+
+    On disk every file's entry is its own small JSON file under .assistant/ast_cache/, read the
+    first time that path is looked up, so startup loads nothing and a save writes only the
+    entries that changed.
+    """
+
+    def __init__(self, root_dir=".", persist=True):
+        self.cache_dir = os.path.dirname(state_path("ast_cache", "entry", root=root_dir)) if persist else None
+        self.entries = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        atexit.register(self.save)
+
+    def _entry_path(self, path):
+        digest = hashlib.sha1(path.encode("utf-8", errors="replace")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json")
+
+    def _entry(self, path):
+        entry = self.entries.get(path)
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._entry_path(path), "r") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if entry.get("path") != path or entry.get("version") != ANALYSIS_VERSION:
+                return None
+            self.entries[path] = entry
+        return entry
+
+    def _lookup(self, path):
+        """Return the cached analysis if path is unchanged, or None if it needs parsing."""
+        entry = self._entry(path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["result"]
+        # Touched but possibly unchanged: a hash match still avoids re-parsing
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if digest == entry["hash"]:
+            entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            self.dirty.add(path)
+            return entry["result"]
+        return None
+
+    def _store(self, path, mtime, size, digest, result):
+        self.entries[path] = {"path": path, "version": ANALYSIS_VERSION, "mtime": mtime, "size": size,
+                              "hash": digest, "result": result}
+        self.dirty.add(path)
+
+    def analyze_file(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            result = self._lookup(path)
+            if result is None:
+                result = self._store_result(_read_and_analyze(path))
+            return result
+
+    def _store_result(self, item):
+        path, mtime, size, digest, result = item
+        self._store(path, mtime, size, digest, result)
+        return result
+
+    def analyze_files(self, paths, workers=None):
+        """Analyze many files, parsing cache misses across a process pool when there are enough of them."""
+        paths = [os.path.normpath(path) for path in paths]
+        results = {}
+        with self.lock:
+            misses = []
+            for path in paths:
+                result = self._lookup(path)
+                if result is None:
+                    misses.append(path)
+                else:
+                    results[path] = result
+            if len(misses) >= PARALLEL_THRESHOLD:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                    analyzed = list(pool.map(_safe_read_and_analyze, misses, chunksize=16))
+            else:
+                analyzed = [_safe_read_and_analyze(path) for path in misses]
+            for item in analyzed:
+                if item is not None:
+                    results[item[0]] = self._store_result(item)
+        return results
+
+    def prune(self, existing_paths):
+        with self.lock:
+            existing = {os.path.normpath(path) for path in existing_paths}
+            for path in [path for path in self.entries if path not in existing]:
+                del self.entries[path]
+                self.dirty.discard(path)
+            if not self.cache_dir:
+                return
+            for directory, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    entry_path = os.path.join(directory, name)
+                    try:
+                        with open(entry_path, "r") as f:
+                            stale = json.load(f).get("path") not in existing
+                    except (OSError, ValueError):
+                        stale = True
+                    if stale:
+                        os.remove(entry_path)
+
+    def save(self):
+        """Write the entries that changed since the last save."""
+        if not self.cache_dir:
+            return
+        with self.lock:
+            for path in self.dirty:
+                entry_path = self._entry_path(path)
+                os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+                atomic_write(entry_path, json.dumps(self.entries[path]), fsync=False)
+            self.dirty.clear()
+
+def _safe_read_and_analyze(path):
+    try:
+        return _read_and_analyze(path)
+    except OSError:
+        return None
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
+
+def analyze_file(path):
+    # Saved in batches (and at exit) rather than per call, which made cold runs quadratic
+    cache = get_analysis_cache()
+    result = cache.analyze_file(path)
+    if len(cache.dirty) >= SAVE_BATCH:
+        cache.save()
+    return result
+
+def analyze_files(paths, workers=None):
+    cache = get_analysis_cache()
+    results = cache.analyze_files(paths, workers)
+    cache.save()
+    return results
@@ -0,0 +1,132 @@
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ai_interface import AIInterface
+from context_window import ContextWindow
+from project_state import ProjectState
+
+def read_tasks(stream):
+    """Parse batch tasks from JSONL; each line is a prompt string or an object with "prompt" or "prompts".
+
+    Objects may also set "id" and "model". Blank lines and lines starting with # are skipped.
+    """
+    tasks = []
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            task = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON: {e}")
+        if isinstance(task, str):
+            task = {"prompt": task}
+        if not isinstance(task, dict):
+            raise ValueError(f"Line {line_number}: expected a string or an object")
+        prompts = task.get("prompts") or ([task["prompt"]] if task.get("prompt") else [])
+        if not prompts:
+            raise ValueError(f"Line {line_number}: task has no prompt")
+        tasks.append({"id": str(task.get("id", len(tasks) + 1)), "index": len(tasks), "prompts": prompts,
+                      "model": task.get("model")})
+    return tasks
+
+def _usage_since(before, totals):
+    """Token usage between two snapshots of AIInterface.usage_totals."""
+    return {key: value - before.get(key, 0) for key, value in totals.items()}
+
+class BatchRunner:
+    """Runs batch tasks concurrently, each with its own AIInterface and conversation state.
+
+    Tasks only share what is safe to share: HTTP clients, rate limiters, the file index and
+    the optional response cache. Results are written as JSONL as soon as each task finishes.
+    """
+
+    def __init__(self, model_name, system_prompt, tools, concurrency=4, context_budget=60000,
+                 fan_out_models=None, response_cache=None, state_dir=None):
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.concurrency = max(1, concurrency)
+        self.context_budget = context_budget
+        self.fan_out_models = fan_out_models or []
+        self.response_cache = response_cache
+        self.state_dir = state_dir
+        self.write_lock = threading.Lock()
+
+    def _project_state(self, task):
+        if not self.state_dir:
+            return ProjectState(persist=False)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", task["id"])
+        return ProjectState(journal_dir=os.path.join(self.state_dir, name))
+
+    def run_task(self, task):
+        started = time.time()
+        result = {"id": task["id"], "index": task["index"], "model": task["model"] or self.model_name,
+                  "status": "ok", "turns": [], "response": None, "error": None}
+        ai_interface = None
+        try:
+            ai_interface = AIInterface(result["model"], stream=False,
+                                       context_window=ContextWindow(token_budget=self.context_budget),
+                                       fan_out_models=self.fan_out_models, response_cache=self.response_cache,
+                                       raise_errors=True)
+            project_state = self._project_state(task)
+            for prompt in task["prompts"]:
+                turn_started = time.perf_counter()
+                before = dict(ai_interface.usage_totals)
+                response = ai_interface.chat(prompt, project_state.conversation_history,
+                                             self.system_prompt, self.tools)
+                project_state.add_to_history({"role": "user", "content": prompt})
+                project_state.add_to_history({"role": "assistant", "content": response})
+                result["turns"].append({"prompt": prompt, "response": response,
+                                        "elapsed_seconds": round(time.perf_counter() - turn_started, 3),
+                                        "tokens": _usage_since(before, ai_interface.usage_totals)})
+                result["response"] = response
+            project_state.save()
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        # Everything the task used, including requests made before a failure
+        result["tokens"] = dict(ai_interface.usage_totals) if ai_interface else {}
+        result["started_at"] = started
+        result["elapsed_seconds"] = round(time.time() - started, 3)
+        return result
+
+    def run(self, tasks, output):
+        """Run every task and write one JSON result line per task; return a summary dict."""
+        summary = {"tasks": len(tasks), "ok": 0, "error": 0, "elapsed_seconds": 0.0,
+                   "input_tokens": 0, "output_tokens": 0}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tasks) or 1)) as pool:
+            futures = [pool.submit(self.run_task, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                summary[result["status"]] += 1
+                summary["input_tokens"] += result["tokens"].get("input_tokens", 0)
+                summary["output_tokens"] += result["tokens"].get("output_tokens", 0)
+                with self.write_lock:
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+def run_batch(input_path, output_path, runner):
+    """Run tasks from input_path ("-" for stdin) and write results to output_path ("-" for stdout).
+
+    Everything the assistant prints while working goes to stderr, so stdout carries only results.
+    """
+    input_file = sys.stdin if input_path == "-" else open(input_path, "r")
+    output_file = sys.stdout if output_path == "-" else open(output_path, "w")
+    try:
+        tasks = read_tasks(input_file)
+        with contextlib.redirect_stdout(sys.stderr):
+            return runner.run(tasks, output_file)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
@@ -0,0 +1,365 @@
+"""Offline benchmarks for the assistant's local hot paths.
+
+Each case runs in a fresh interpreter inside a synthetic project, so in-process caches and
+singletons never leak between cases, and model calls go to a local fake server that speaks
+the Anthropic Messages API (including SSE streaming). Results are saved under
+.assistant/benchmarks/ and can be compared against an earlier run:
+
+    python benchmark.py                          # default sizes
+    python benchmark.py --tree-sizes 1000,100000,1000000 --cases tree_scan
+    python benchmark.py --compare latest         # flag regressions against the last saved run
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from instrumentation import percentile
+from utils import state_path, atomic_write
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+FILES_PER_DIR = 100
+
+# ---------------------------------------------------------------- synthetic inputs
+
+def make_tree(root, file_count):
+    """A project of file_count small files, FILES_PER_DIR per directory, nested two levels deep."""
+    for index in range(file_count):
+        directory = os.path.join(root, f"pkg{index // (FILES_PER_DIR * FILES_PER_DIR)}",
+                                 f"mod{index // FILES_PER_DIR % FILES_PER_DIR}")
+        if index % FILES_PER_DIR == 0:
+            os.makedirs(directory, exist_ok=True)
+        suffix = (".py", ".txt", ".js", ".md")[index % 4]
+        with open(os.path.join(directory, f"file{index}{suffix}"), "w") as f:
+            f.write(f"# file {index}\n")
+
+def make_module(index, functions=40, classes=10):
+    """Python source with a realistic mix of imports, docstrings, functions, classes and methods."""
+    lines = [f'"""Synthetic module {index}."""', "import os", "import json", "from collections import defaultdict", ""]
+    for number in range(functions):
+        lines += [f"def function_{index}_{number}(alpha, beta=None, *args, **kwargs):",
+                  f'    """Compute value {number} for module {index}."""',
+                  "    total = 0",
+                  "    for item in range(alpha):",
+                  "        total += item * (beta or 1)",
+                  "    return json.dumps({'total': total, 'path': os.getcwd()})", ""]
+    for number in range(classes):
+        lines += [f"class Widget{index}_{number}(object):",
+                  f'    """Widget number {number}."""', "",
+                  "    def __init__(self, name):",
+                  "        self.name = name",
+                  "        self.items = defaultdict(list)", "",
+                  "    def render(self, depth=0):",
+                  "        return [self.name] * depth", ""]
+    return "\n".join(lines) + "\n"
+
+def make_codebase(root, module_count):
+    for index in range(module_count):
+        directory = os.path.join(root, "src", f"package{index // FILES_PER_DIR}")
+        if index % FILES_PER_DIR == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module{index}.py"), "w") as f:
+            f.write(make_module(index))
+
+def make_history(message_count):
+    history = []
+    for index in range(message_count):
+        if index % 2 == 0:
+            history.append({"role": "user", "content": f"Please update function_{index} to handle edge case {index}."})
+        else:
+            history.append({"role": "assistant", "content": "Done. " + "Here is the explanation. " * 20})
+    return history
+
+# ---------------------------------------------------------------- fake model server
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/messages; the first request of a turn asks for read_file, the follow-up replies with text."""
+
+    chunks = 20
+    chunk_text = "token "
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        last = request["messages"][-1]["content"]
+        wants_tool = bool(request.get("tools")) and not (
+            isinstance(last, list) and any(block.get("type") == "tool_result" for block in last))
+        if wants_tool:
+            blocks = [{"type": "tool_use", "id": "toolu_bench", "name": "read_file", "input": {"path": "README.md"}}]
+            stop_reason = "tool_use"
+        else:
+            blocks = [{"type": "text", "text": self.chunk_text * self.chunks}]
+            stop_reason = "end_turn"
+        usage = {"input_tokens": 1000, "output_tokens": self.chunks}
+        message = {"id": "msg_bench", "type": "message", "role": "assistant", "model": request["model"],
+                   "content": blocks, "stop_reason": stop_reason, "stop_sequence": None, "usage": usage}
+        if request.get("stream"):
+            self._stream(message)
+        else:
+            self._send(200, "application/json", json.dumps(message).encode())
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, message):
+        events = [("message_start", {"type": "message_start",
+                                     "message": dict(message, content=[], stop_reason=None,
+                                                     usage={"input_tokens": 1000, "output_tokens": 0})})]
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                events.append(("content_block_start", {"type": "content_block_start", "index": index,
+                                                       "content_block": {"type": "text", "text": ""}}))
+                for _ in range(self.chunks):
+                    events.append(("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                           "delta": {"type": "text_delta", "text": self.chunk_text}}))
+            else:
+                events.append(("content_block_start", {"type": "content_block_start", "index": index,
+                                                       "content_block": dict(block, input={})}))
+                events.append(("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                       "delta": {"type": "input_json_delta",
+                                                                 "partial_json": json.dumps(block["input"])}}))
+            events.append(("content_block_stop", {"type": "content_block_stop", "index": index}))
+        events.append(("message_delta", {"type": "message_delta",
+                                         "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                         "usage": {"output_tokens": self.chunks}}))
+        events.append(("message_stop", {"type": "message_stop"}))
+        body = "".join(f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events).encode()
+        self._send(200, "text/event-stream", body)
+
+@contextlib.contextmanager
+def fake_model_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAnthropicHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# ---------------------------------------------------------------- cases (run inside a worker process)
+
+def _time(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def case_tree_scan(size, repeat):
+    from context_analysis import analyze_project_structure
+    from file_index import FileIndex
+    make_tree(".", size)
+    results = {f"tree_scan.cold[{size}]": _time(analyze_project_structure, repeat)}
+    index = FileIndex(persist=False, use_inotify=False)
+    index.refresh()
+    results[f"tree_scan.incremental[{size}]"] = _time(index.refresh, repeat)
+    return results
+
+def case_state(size, repeat):
+    from project_state import ProjectState
+    history = make_history(size)
+    results = {}
+
+    def fresh():
+        shutil.rmtree("journal", ignore_errors=True)
+        state = ProjectState(journal_dir="journal")
+        state.conversation_history = list(history)
+        return state
+
+    def first_save():
+        fresh().save()
+
+    results[f"state.save_full[{size}]"] = _time(first_save, repeat)
+    state = fresh()
+    state.save()
+
+    def incremental_save():
+        state.conversation_history += history[:2]
+        state.save()
+
+    results[f"state.save_incremental[{size}]"] = _time(incremental_save, repeat)
+    loader = ProjectState(journal_dir="journal")
+    results[f"state.load[{size}]"] = _time(loader.load, repeat)
+    results[f"state.load_tail100[{size}]"] = _time(lambda: loader.load(max_messages=100), repeat)
+    return results
+
+def case_analysis(size, repeat):
+    import ast_analysis
+    from context_analysis import analyze_file_content
+    from doc_generation import generate_project_docs
+    make_codebase(".", size)
+    paths = [os.path.join(root, name) for root, _, names in os.walk("src") for name in names]
+
+    def cold_analysis():
+        ast_analysis._cache = None
+        shutil.rmtree(os.path.dirname(state_path("ast_cache.json")), ignore_errors=True)
+        for path in paths:
+            analyze_file_content(path)
+
+    results = {f"analysis.cold[{size}]": _time(cold_analysis, repeat)}
+    results[f"analysis.warm[{size}]"] = _time(lambda: [analyze_file_content(path) for path in paths], repeat)
+
+    def reset_docs():
+        ast_analysis._cache = None
+        shutil.rmtree(os.path.dirname(state_path("docs_manifest.json")), ignore_errors=True)
+
+    results[f"docs.cold[{size}]"] = _time(generate_project_docs, repeat, setup=reset_docs)
+    results[f"docs.incremental[{size}]"] = _time(generate_project_docs, repeat)
+    return results
+
+def case_execute(size, repeat):
+    from code_execution import execute_code, get_worker_pool, safe_execute_code
+    snippet = "import json\nprint(json.dumps({'value': sum(range(1000))}))"
+    pool = get_worker_pool()
+    safe_execute_code(snippet)  # Wait for the pool to warm up
+    results = {"execute.subprocess": _time(lambda: execute_code(snippet), repeat),
+               "execute.pool": _time(lambda: safe_execute_code(snippet), repeat * 5)}
+    pool.shutdown()
+    return results
+
+def case_turn(size, repeat):
+    from ai_interface import AIInterface
+    from tools import TOOLS
+    with open("README.md", "w") as f:
+        f.write("# Benchmark project\n" * 50)
+    history = make_history(size)
+    results = {}
+    with fake_model_server() as url:
+        os.environ["ANTHROPIC_BASE_URL"] = url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "sk-benchmark")
+        for stream in (True, False):
+            ai_interface = AIInterface("claude", stream=stream)
+            label = "streaming" if stream else "blocking"
+            with contextlib.redirect_stdout(io.StringIO()):
+                ai_interface.model  # Build the client outside the timed region
+                results[f"turn.{label}[{size} messages]"] = _time(
+                    lambda: ai_interface.chat("Summarize README.md", history, "You are a benchmark.", TOOLS), repeat)
+    return results
+
+CASES = {
+    "tree_scan": (case_tree_scan, "tree_sizes"),
+    "state": (case_state, "history_sizes"),
+    "analysis": (case_analysis, "module_counts"),
+    "execute": (case_execute, None),
+    "turn": (case_turn, "turn_history_sizes"),
+}
+
+def run_worker(case, size, repeat, result_file):
+    function, _ = CASES[case]
+    samples = function(size, repeat)
+    atomic_write(result_file, json.dumps(samples))
+
+# ---------------------------------------------------------------- orchestration
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {"runs": len(ordered), "min": ordered[0], "median": percentile(ordered, 50),
+            "p95": percentile(ordered, 95), "max": ordered[-1]}
+
+def run_case(case, size, repeat):
+    """Run one case in a fresh interpreter inside its own temporary project directory."""
+    root = tempfile.mkdtemp(prefix=f"bench-{case}-")
+    result_file = os.path.join(root, ".result.json")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [MODULE_DIR, os.getenv("PYTHONPATH")])))
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", case, "--size", str(size),
+                        "--repeat", str(repeat), "--result-file", result_file],
+                       cwd=root, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_file, "r") as f:
+            return {name: summarize(samples) for name, samples in json.load(f).items()}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=MODULE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_run(path):
+    if path == "latest":
+        path = state_path("benchmarks", "latest.json")
+    with open(path, "r") as f:
+        return json.load(f)
+
+def compare(current, baseline, threshold):
+    """Print median changes against a baseline run and return the names that regressed."""
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            continue
+        change = result["median"] / previous["median"] - 1 if previous["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<44} {previous['median'] * 1000:10.2f} -> {result['median'] * 1000:10.2f} ms "
+              f"({change:+.0%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the assistant's local hot paths")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma-separated cases to run")
+    parser.add_argument("--tree-sizes", default="1000,10000", help="File counts for tree_scan (up to 1000000)")
+    parser.add_argument("--history-sizes", default="1000,10000", help="Message counts for state save/load")
+    parser.add_argument("--module-counts", default="100,1000", help="Module counts for analysis and docs")
+    parser.add_argument("--turn-history-sizes", default="10,200", help="History lengths for end-to-end turns")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per measurement")
+    parser.add_argument("--output", help="Where to save results (default: .assistant/benchmarks/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="RUN", help="Baseline results file, or 'latest'")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Median slowdown counted as a regression (default: 0.2 = 20%%)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.size, args.repeat, args.result_file)
+        return 0
+
+    baseline = load_run(args.compare) if args.compare else None
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+           "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+           "results": {}}
+    for case in [name for name in args.cases.split(",") if name]:
+        if case not in CASES:
+            parser.error(f"unknown case: {case}")
+        sizes_option = CASES[case][1]
+        sizes = [int(size) for size in getattr(args, sizes_option).split(",")] if sizes_option else [0]
+        for size in sizes:
+            for name, result in run_case(case, size, args.repeat).items():
+                run["results"][name] = result
+                print(f"{name:<44} median {result['median'] * 1000:10.2f} ms   "
+                      f"p95 {result['p95'] * 1000:10.2f} ms   ({result['runs']} runs)", flush=True)
+
+    output = args.output or state_path("benchmarks", run["timestamp"].replace(":", "") + ".json")
+    atomic_write(output, json.dumps(run, indent=2))
+    atomic_write(state_path("benchmarks", "latest.json"), json.dumps(run, indent=2))
+    print(f"\nResults saved to {output}")
+    if baseline and compare(run, baseline, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import contextvars
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from file_index import get_file_index
+from instrumentation import span, add
+from utils import state_path, atomic_write, print_colored, TOOL_COLOR
+
+MAX_SUMMARY_CHARS = 4000
+MAX_PROBLEMS = 20      # Failures or problem lines shown per check
+TRACE_LINES = 8        # Last lines of each failing test's traceback kept in the summary
+OUTPUT_TAIL_LINES = 40
+
+_PROBLEM_LINE = re.compile(r"^(?P<path>[^\s:][^:]*):(?P<line>\d+):(?:\d+:)?\s*(?P<message>.+)$")
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def checks_config():
+    """Check runner settings, overridable through ASSISTANT_CHECK* environment variables."""
+    return {
+        "shards": max(1, _env_int("ASSISTANT_CHECK_SHARDS", min(8, os.cpu_count() or 1))),
+        "timeout": _env_int("ASSISTANT_CHECK_TIMEOUT", 600),
+        "checks": [name for name in os.getenv("ASSISTANT_CHECKS", "").split(",") if name],
+    }
+
+def _command(tool):
+    """How to invoke tool: as a module of this interpreter if importable, else from PATH."""
+    if find_spec(tool) is not None:
+        return [sys.executable, "-m", tool]
+    executable = shutil.which(tool)
+    return [executable] if executable else None
+
+def _configured(section):
+    """Whether the project configures a tool (mypy, pyright) in one of the usual places."""
+    for name, marker in (("pyproject.toml", f"[tool.{section}"), ("setup.cfg", f"[{section}"),
+                         (f"{section}.ini", ""), (f".{section}.ini", ""), (f"{section}config.json", "")):
+        if os.path.exists(name):
+            with open(name, "r", errors="replace") as f:
+                if marker in f.read():
+                    return True
+    return False
+
+def discover_tests(root_dir="."):
+    index = get_file_index(root_dir)
+    index.refresh()
+    return sorted(path for path in index.iter_files(".py")
+                  if os.path.basename(path).startswith("test_") or path.endswith("_test.py"))
+
+def available_checks(root_dir="."):
+    """Checks that apply to this project: pytest if it has tests, linters that are installed,
+    and type checkers that are installed and configured."""
+    checks = []
+    if _command("pytest") and discover_tests(root_dir):
+        checks.append("pytest")
+    linter = "ruff" if _command("ruff") else "flake8" if _command("flake8") else None
+    if linter:
+        checks.append(linter)
+    for checker in ("mypy", "pyright"):
+        if _command(checker) and _configured(checker):
+            checks.append(checker)
+    return checks
+
+LINT_ARGS = {
+    "ruff": ["check", "--output-format", "concise"],
+    "flake8": [],
+    "mypy": ["--no-error-summary", "--no-color-output", "--hide-error-context"],
+    "pyright": [],
+}
+CHECK_NAMES = ("pytest",) + tuple(LINT_ARGS)
+
+class CheckResult:
+    def __init__(self, name):
+        self.name = name
+        self.status = "ok"     # ok, failed or error
+        self.counts = {}
+        self.problems = []     # Lines for the summary, most important first
+        self.output_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        self.matched = []      # Every output line matching the runner's pattern, not just those in the tail
+        self.duration = 0.0
+
+    def header(self):
+        counts = ", ".join(f"{value} {key}" for key, value in self.counts.items() if value)
+        return f"{self.name}: {self.status}" + (f" ({counts})" if counts else "") + f" in {self.duration:.1f}s"
+
+def _run_streamed(label, command, timeout, result, stream=True, pattern=None):
+    """Run command, echoing its output live with a [label] prefix; returns the exit code (None on timeout).
+
+    Lines matching pattern are collected into result.matched as they stream past.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                               text=True, errors="replace", bufsize=1)
+    killed = threading.Event()
+
+    def kill():
+        killed.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            result.output_tail.append(line)
+            if pattern is not None and pattern.match(line):
+                result.matched.append(line)
+            if stream:
+                print_colored(f"[{label}] {line}", TOOL_COLOR)
+        process.wait()
+    finally:
+        timer.cancel()
+    return None if killed.is_set() else process.returncode
+
+class CheckHistory:
+    """Failed test ids and per-file durations from earlier runs, kept under .assistant/checks/."""
+
+    def __init__(self, persist=True):
+        self.path = state_path("checks", "history.json") if persist else None
+        self.failed = []
+        self.durations = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.failed, self.durations = data["failed"], data["durations"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def record(self, passed, failed, durations, full_run):
+        if full_run:
+            self.failed = sorted(failed)
+        else:
+            # A partial run only settles the tests it ran
+            self.failed = sorted((set(self.failed) - set(passed)) | set(failed))
+        self.durations.update(durations)
+        self.durations = {path: seconds for path, seconds in self.durations.items() if os.path.exists(path)}
+        if self.path:
+            atomic_write(self.path, json.dumps({"failed": self.failed, "durations": self.durations}))
+
+def shard(targets, shards, durations):
+    """Split targets (files or test ids) into at most shards groups of similar expected duration.
+
+    Tests of one file stay together so module fixtures are set up once; expected duration is
+    the file's time in the last run, or its size for files not seen yet.
+    """
+    by_file = {}
+    for target in targets:
+        by_file.setdefault(target.split("::")[0], []).append(target)
+
+    def cost(path):
+        if path in durations:
+            return durations[path]
+        try:
+            return os.path.getsize(path) / 10000
+        except OSError:
+            return 0.1
+
+    groups = [[0.0, []] for _ in range(min(shards, len(by_file)))]
+    for path in sorted(by_file, key=cost, reverse=True):
+        group = min(groups, key=lambda item: item[0])
+        group[0] += cost(path)
+        group[1].extend(by_file[path])
+    return [items for _, items in groups if items]
+
+def _test_id(case):
+    path = case.get("file") or ""
+    module = path[:-3].replace("/", ".") if path.endswith(".py") else ""
+    classname = case.get("classname", "")
+    rest = classname[len(module) + 1:] if module and classname.startswith(module + ".") else ""
+    return "::".join(part for part in (path, rest.replace(".", "::"), case.get("name", "")) if part)
+
+def parse_junit(path):
+    """(passed, failures, durations, skipped) from a junit XML report; failures are (test id, message, trace)."""
+    passed, failures, durations, skipped = [], [], {}, 0
+    for case in ElementTree.parse(path).getroot().iter("testcase"):
+        test_id = _test_id(case.attrib)
+        file_path = test_id.split("::")[0]
+        durations[file_path] = durations.get(file_path, 0.0) + float(case.get("time") or 0)
+        problem = case.find("failure")
+        if problem is None:
+            problem = case.find("error")
+        if problem is not None:
+            trace = [line for line in (problem.text or "").splitlines() if line.strip()]
+            message = (problem.get("message") or "").strip().splitlines()
+            failures.append((test_id, message[0] if message else "", trace[-TRACE_LINES:]))
+        elif case.find("skipped") is not None:
+            skipped += 1
+        else:
+            passed.append(test_id)
+    return passed, failures, durations, skipped
+
+def run_pytest(paths=None, only_failed=False, shards=4, timeout=600, history=None, stream=True):
+    history = history or CheckHistory()
+    result = CheckResult("pytest")
+    targets = list(paths or [])
+    if only_failed:
+        targets = list(history.failed)
+        if not targets:
+            result.problems.append("No failed tests recorded; nothing to re-run.")
+            return result
+    full_run = not targets
+    targets = targets or discover_tests()
+    groups = shard(targets, shards, history.durations)
+    passed, failures, durations, skipped, errors = [], [], {}, 0, []
+    with tempfile.TemporaryDirectory() as report_dir:
+        def run_shard(index, group):
+            report = os.path.join(report_dir, f"shard{index}.xml")
+            command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-o", "junit_family=xunit1",
+                       "--junitxml", report, *group]
+            label = f"pytest {index + 1}/{len(groups)}" if len(groups) > 1 else "pytest"
+            return report, _run_streamed(label, command, timeout, result, stream)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(groups))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run_shard, index, group)
+                       for index, group in enumerate(groups)]
+            for future in futures:
+                report, code = future.result()
+                if code is None:
+                    errors.append(f"a shard timed out after {timeout}s")
+                # 0: all passed, 1: some failed, 5: nothing collected; anything else is a usage or internal error
+                elif code not in (0, 1, 5) or not os.path.exists(report):
+                    errors.append(f"a shard exited with status {code}")
+                    continue
+                if os.path.exists(report):
+                    shard_passed, shard_failures, shard_durations, shard_skipped = parse_junit(report)
+                    passed += shard_passed
+                    failures += shard_failures
+                    durations.update(shard_durations)
+                    skipped += shard_skipped
+
+    history.record(passed, [test_id for test_id, _, _ in failures], durations, full_run)
+    result.counts = {"failed": len(failures), "passed": len(passed), "skipped": skipped}
+    for test_id, message, trace in failures:
+        result.problems.append(f"FAILED {test_id}" + (f" - {message}" if message else ""))
+        result.problems.extend(f"    {line}" for line in trace)
+    if errors:
+        result.status = "error"
+        result.problems[:0] = [f"pytest: {error}" for error in errors] + [f"    {line}" for line in
+                                                                             list(result.output_tail)[-TRACE_LINES:]]
+    elif failures:
+        result.status = "failed"
+    return result
+
+def run_linter(name, paths=None, timeout=600, stream=True):
+    result = CheckResult(name)
+    command = _command(name)
+    if command is None:
+        result.status = "error"
+        result.problems.append(f"{name} is not installed")
+        return result
+    # Paths may be pytest node ids; linters only understand the file part
+    targets = list(dict.fromkeys(path.split("::")[0] for path in paths or ["."]))
+    code = _run_streamed(name, command + LINT_ARGS.get(name, []) + targets, timeout, result, stream, _PROBLEM_LINE)
+    problems = result.matched
+    if code is None:
+        result.status = "error"
+        result.problems.append(f"timed out after {timeout}s")
+    elif code != 0:
+        result.status = "failed" if problems else "error"
+        result.problems.extend(problems or list(result.output_tail)[-TRACE_LINES:])
+    result.counts = {"problems": len(problems)}
+    return result
+
+def summarize(results, max_chars=MAX_SUMMARY_CHARS):
+    """One header per check, then problem lines until max_chars is used up."""
+    lines = [result.header() for result in results]
+    used = sum(len(line) + 1 for line in lines)
+    for result in results:
+        if not result.problems:
+            continue
+        shown = []
+        for problem in result.problems:
+            if len(shown) >= MAX_PROBLEMS * (TRACE_LINES + 1) or used + len(problem) + 1 > max_chars:
+                break
+            shown.append(problem)
+            used += len(problem) + 1
+        lines.append(f"\n{result.name}:")
+        lines.extend(shown)
+        if len(shown) < len(result.problems):
+            lines.append(f"[... {len(result.problems) - len(shown)} more lines omitted]")
+    return "\n".join(lines)
+
+def run_checks(checks=None, paths=None, only_failed=False, max_chars=MAX_SUMMARY_CHARS, stream=True):
+    """Run tests, linters and type checkers in parallel and return a size-capped summary of the failures.
+
+    Output streams to the terminal as it arrives; the model only sees the summary. With
+    only_failed, pytest re-runs just the tests that failed last time.
+    """
+    config = checks_config()
+    try:
+        names = list(checks or config["checks"] or available_checks())
+        if not names:
+            return "No checks found: install pytest, ruff or flake8, or set ASSISTANT_CHECKS."
+        if only_failed:
+            names = ["pytest"]
+        runners = {"pytest": lambda: run_pytest(paths, only_failed, config["shards"], config["timeout"], stream=stream)}
+        unknown = [name for name in names if name not in CHECK_NAMES]
+        if unknown:
+            return f"Error: unknown checks: {', '.join(unknown)} (available: {', '.join(CHECK_NAMES)})"
+
+        def run_one(name):
+            with span("check", check=name) as check:
+                started = time.perf_counter()
+                result = runners[name]() if name in runners else run_linter(name, paths, config["timeout"], stream)
+                result.duration = time.perf_counter() - started
+                check.set(status=result.status)
+                return result
+
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            # Each check runs in a copy of this context, so streamed output follows the caller's session
+            futures = [pool.submit(contextvars.copy_context().run, run_one, name) for name in names]
+            results = [future.result() for future in futures]
+        add("checks_failed", sum(result.status != "ok" for result in results))
+        return summarize(results, max_chars)
+    except Exception as e:
+        return f"Error running checks: {str(e)}"
@@ -1,17 +1,20 @@
-import readline
 import os
 from utils import print_colored, USER_COLOR, CLAUDE_COLOR, TOOL_COLOR, RESULT_COLOR, Style
-from code_execution import safe_execute_code
+from code_execution import safe_execute_code, get_worker_pool
 from package_management import update_requirements, install_packages
 from context_analysis import get_context_suggestions
-from doc_generation import generate_project_docs
+from doc_generation import write_project_docs
+from checks import run_checks, CHECK_NAMES
+from instrumentation import get_tracer
 
 class CLI:
-    def __init__(self, ai_interface, project_state, system_prompt, tools):
+    def __init__(self, ai_interface, project_state, system_prompt, tools, prompt=input):
         self.ai_interface = ai_interface
         self.project_state = project_state
         self.system_prompt = system_prompt
         self.tools = tools
+        # Asks the user for a command's argument; the daemon routes this to the attached client
+        self.prompt = prompt
         self.commands = {
             "/save": self.save_state,
             "/load": self.load_state,
@@ -21,11 +24,14 @@ class CLI:
             "/update_requirements": self.update_requirements,
             "/install_packages": self.install_packages,
             "/analyze": self.analyze_context,
-            "/generate_docs": self.generate_docs
+            "/generate_docs": self.generate_docs,
+            "/stats": self.show_stats,
+            "/check": self.run_checks
         }
-        self.setup_autocomplete()
+        get_worker_pool()  # Start warming execution workers in the background
 
     def setup_autocomplete(self):
+        import readline  # Only the interactive loop needs line editing
         readline.set_completer(self.autocomplete)
         readline.parse_and_bind("tab: complete")
 
@@ -47,9 +53,13 @@ class CLI:
         print_colored("Project state loaded.", RESULT_COLOR)
 
     def switch_model(self):
-        """Switch between AI models (not fully implemented)"""
-        # Implement model switching logic
-        pass
+        """Switch between AI models"""
+        model_name = self.prompt("Enter the model to use (claude/gpt4): ").strip()
+        try:
+            self.ai_interface.switch_model(model_name)
+            print_colored(f"Switched to {model_name}.", RESULT_COLOR)
+        except Exception as e:
+            print_colored(f"Could not switch model: {str(e)}", TOOL_COLOR)
 
     def show_help(self):
         """Show this help message"""
@@ -61,7 +71,7 @@ class CLI:
 
     def execute_code(self):
         """Execute a Python code snippet"""
-        code = input("Enter Python code to execute: ")
+        code = self.prompt("Enter Python code to execute: ")
         output, error = safe_execute_code(code)
         if output:
             print_colored(f"Output:\n{output}", RESULT_COLOR)
@@ -69,11 +79,13 @@ class CLI:
             print_colored(f"Error:\n{error}", TOOL_COLOR)
 
     def update_requirements(self):
-        """Update requirements.txt based on imports in a file"""
-        file_path = input("Enter the path of the Python file to analyze: ")
-        with open(file_path, 'r') as file:
-            content = file.read()
-        result = update_requirements(content)
+        """Update requirements.txt based on imports in a file or the whole project"""
+        file_path = self.prompt("Enter the path of the Python file to analyze (leave empty for the whole project): ").strip()
+        if file_path:
+            with open(file_path, 'r') as file:
+                result = update_requirements(file.read())
+        else:
+            result = update_requirements()
         print_colored(result, RESULT_COLOR)
 
     def install_packages(self):
@@ -83,39 +95,64 @@ class CLI:
 
     def analyze_context(self):
         """Get context-aware suggestions for a file"""
-        current_file = input("Enter the path of the current file: ")
+        current_file = self.prompt("Enter the path of the current file: ")
         suggestions = get_context_suggestions(self.project_state.file_structure, current_file)
         for suggestion in suggestions:
             print_colored(suggestion, RESULT_COLOR)
 
     def generate_docs(self):
         """Generate basic documentation for the project"""
-        docs = generate_project_docs()
-        print_colored(docs, RESULT_COLOR)
-        with open("project_documentation.md", "w") as f:
-            f.write(docs)
+        stats = write_project_docs("project_documentation.md")
+        print_colored(f"Documented {stats['modules']} modules ({stats['regenerated']} regenerated, "
+                      f"{stats['reused']} unchanged).", RESULT_COLOR)
         print_colored("Documentation saved to project_documentation.md", RESULT_COLOR)
 
+    def run_checks(self):
+        """Run tests and linters in parallel ('failed' re-runs only the failed tests)"""
+        request = self.prompt("Checks or paths to run (leave empty for all, 'failed' for failed tests): ").split()
+        names = [item for item in request if item in CHECK_NAMES]
+        paths = [item for item in request if item not in names and item != "failed"]
+        print_colored(run_checks(names, paths, only_failed="failed" in request), RESULT_COLOR)
+
+    def show_stats(self):
+        """Show timing percentiles and counters for this session"""
+        print_colored(get_tracer().format_stats(), RESULT_COLOR)
+        window = self.ai_interface.context_window.stats
+        if window["requests"]:
+            print_colored(f"Context window: {window['requests']} requests, "
+                          f"{window['tokens_sent'] // window['requests']} tokens on average, "
+                          f"{window['max_request_tokens']} max, {window['last_request_tokens']} last "
+                          f"({window['messages_summarized']} older messages summarized, "
+                          f"{window['messages_dropped']} dropped)", RESULT_COLOR)
+
     def run(self):
-        print("Debug: CLI run method started")
+        self.setup_autocomplete()
         while True:
             user_input = input(f"\n{USER_COLOR}You: {Style.RESET_ALL}")
-            if user_input.lower() == 'exit':
-                print_colored("Thank you for using the AI Coding Assistant. Goodbye!", CLAUDE_COLOR)
+            if not self.handle(user_input):
                 break
 
-            if user_input.startswith("/"):
-                command = user_input.split()[0]
-                if command in self.commands:
-                    self.commands[command]()
-                else:
-                    print_colored(f"Unknown command: {command}. Type /help for a list of commands.", RESULT_COLOR)
+    def handle(self, user_input):
+        """Process one line of user input; returns False once the user asks to exit."""
+        if user_input.lower() == 'exit':
+            print_colored("Thank you for using the AI Coding Assistant. Goodbye!", CLAUDE_COLOR)
+            return False
+
+        if user_input.startswith("/"):
+            command = user_input.split()[0]
+            if command in self.commands:
+                self.commands[command]()
             else:
-                print("Debug - System Prompt:", self.system_prompt[:100] + "...")  # Print first 100 chars
-                print("Debug - Tools:", self.tools)
-                response = self.ai_interface.chat(user_input, self.project_state.conversation_history, self.system_prompt, self.tools)
+                print_colored(f"Unknown command: {command}. Type /help for a list of commands.", RESULT_COLOR)
+        else:
+            response = self.ai_interface.chat(user_input, self.project_state.conversation_history, self.system_prompt, self.tools)
+            if not self.ai_interface.last_rendered:
                 print_colored(f"\nAI: {response}", CLAUDE_COLOR)
-                self.project_state.add_to_history({"role": "user", "content": user_input})
-                self.project_state.add_to_history({"role": "assistant", "content": response})
+            usage = self.ai_interface.usage_summary()
+            if usage:
+                print_colored(usage, RESULT_COLOR)
+            self.project_state.add_to_history({"role": "user", "content": user_input})
+            self.project_state.add_to_history({"role": "assistant", "content": response})
 
-            self.project_state.update_file_structure()
\ No newline at end of file
+        self.project_state.update_file_structure()
+        return True
@@ -1,7 +1,20 @@
+import atexit
+import importlib
+import json
+import os
+import queue
 import subprocess
 import sys
 import tempfile
-import os
+import threading
+import traceback
+from multiprocessing.connection import Connection
+from instrumentation import span
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, runs fall back to plain subprocesses
+    resource = None
 
 def execute_code(code):
     with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
@@ -21,6 +34,245 @@ def execute_code(code):
 
     return output, error
 
-def safe_execute_code(code):
-    # Add any additional security measures here
-    return execute_code(code)
\ No newline at end of file
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def pool_config():
+    """Worker pool settings, overridable through ASSISTANT_EXEC_* environment variables."""
+    return {
+        "workers": _env_int("ASSISTANT_EXEC_WORKERS", 2),
+        "preload": [name for name in os.getenv(
+            "ASSISTANT_EXEC_PRELOAD", "json,re,math,collections,itertools,functools,datetime").split(",") if name],
+        "max_runs": _env_int("ASSISTANT_EXEC_MAX_RUNS", 50),
+        "max_rss_mb": _env_int("ASSISTANT_EXEC_MAX_RSS_MB", 512),
+        "memory_limit_mb": _env_int("ASSISTANT_EXEC_MEMORY_MB", 1024),
+        "cpu_seconds": _env_int("ASSISTANT_EXEC_CPU_SECONDS", 10),
+        "timeout": _env_int("ASSISTANT_EXEC_TIMEOUT", 10),
+    }
+
+def _run_snippet(code, cpu_seconds):
+    """Execute code in fresh globals, capturing fd-level stdout/stderr (so child processes are captured too)."""
+    if resource and cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, hard))
+    cwd, path, argv = os.getcwd(), list(sys.path), list(sys.argv)
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        saved = os.dup(1), os.dup(2)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(out.fileno(), 1)
+        os.dup2(err.fileno(), 2)
+        try:
+            exec(compile(code, "<snippet>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+        except SystemExit:
+            pass
+        except BaseException:
+            exc_type, exc, tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc, tb.tb_next)  # Hide the worker's own frame
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            os.chdir(cwd)
+            sys.path[:], sys.argv[:] = path, argv
+        out.seek(0)
+        err.seek(0)
+        return out.read().decode(errors="replace"), err.read().decode(errors="replace")
+
+def _snapshot_modules():
+    return {name: (module, dict(vars(module))) for name, module in list(sys.modules.items())
+            if module is not None and hasattr(module, "__dict__")}
+
+def _restore_modules(baseline):
+    """Undo what a snippet did to the interpreter: forget modules it imported and put back globals it
+    replaced in modules loaded before it ran (builtins included). Returns whether anything was restored."""
+    dirty = False
+    for name in list(sys.modules):
+        if name not in baseline:
+            del sys.modules[name]
+    for name, (module, namespace) in baseline.items():
+        if sys.modules.get(name) is not module:
+            sys.modules[name] = module
+            dirty = True
+        current = vars(module)
+        for key in [key for key in current if key not in namespace]:
+            del current[key]
+            dirty = True
+        for key, value in namespace.items():
+            if current.get(key, namespace) is not value:
+                current[key] = value
+                dirty = True
+    importlib.invalidate_caches()  # So edited or new project files are found on the next import
+    return dirty
+
+def _worker_main(read_fd, write_fd, config_json):
+    """Entry point of a pooled worker process: apply limits, preload modules, then serve snippets.
+
+    Each reply is three length-prefixed frames (output, error, then "rss_kb dirty" in ASCII),
+    so replying never goes through a module a snippet could have patched.
+    """
+    config = json.loads(config_json)
+    requests, responses = Connection(read_fd, writable=False), Connection(write_fd, readable=False)
+    if resource and config["memory_limit_mb"]:
+        limit = config["memory_limit_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    for name in config["preload"]:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+    tempfile.gettempdir()  # Sets tempfile.tempdir, which would otherwise look like a snippet's change
+    baseline = _snapshot_modules()
+    try:
+        responses.send_bytes(b"ready")
+        while True:
+            code = requests.recv_bytes().decode()
+            output, error = _run_snippet(code, config["cpu_seconds"])
+            dirty = _restore_modules(baseline)
+            rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+            responses.send_bytes(output.encode(errors="replace"))
+            responses.send_bytes(error.encode(errors="replace"))
+            responses.send_bytes(f"{rss_kb} {int(dirty)}".encode())
+    except (EOFError, BrokenPipeError):
+        pass  # The parent closed the pool or exited
+
+class WorkerUnavailable(Exception):
+    """A pool worker failed to start; the caller should run the snippet some other way."""
+
+class _Worker:
+    def __init__(self, config):
+        parent_read, child_write = os.pipe()
+        child_read, parent_write = os.pipe()
+        module_dir = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [module_dir, os.getenv("PYTHONPATH")])))
+        bootstrap = (f"import code_execution; "
+                     f"code_execution._worker_main({child_read}, {child_write}, {json.dumps(json.dumps(config))})")
+        self.process = subprocess.Popen([sys.executable, "-c", bootstrap], pass_fds=(child_read, child_write),
+                                        env=env, stdin=subprocess.DEVNULL)
+        os.close(child_read)
+        os.close(child_write)
+        self.requests = Connection(parent_write, readable=False)
+        self.responses = Connection(parent_read, writable=False)
+        self.runs = 0
+
+    def wait_ready(self, timeout=30):
+        if not self.responses.poll(timeout):
+            raise TimeoutError("worker did not start")
+        self.responses.recv_bytes()
+
+    def close(self):
+        self.requests.close()
+        self.responses.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+class WorkerPool:
+    """Pre-warmed Python processes that run snippets without paying interpreter startup.
+
+    Workers run under memory and per-run CPU limits. Modules a snippet imports are dropped
+    after it runs, and a worker whose preloaded modules or builtins were changed is recycled,
+    as it is after max_runs snippets, when its peak RSS exceeds max_rss_mb, or after a timeout
+    or crash.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or pool_config()
+        self.idle = queue.Queue()
+        self.closed = False
+        for _ in range(self.config["workers"]):
+            self._spawn_in_background()
+
+    def _spawn(self):
+        worker = None
+        try:
+            worker = _Worker(self.config)
+            worker.wait_ready()
+        except (TimeoutError, EOFError, OSError) as e:
+            if worker is not None:
+                worker.close()
+            # Wake a waiting caller now instead of letting it sit out the acquire timeout
+            self.idle.put(WorkerUnavailable(f"{type(e).__name__}: {e}"))
+            return
+        if self.closed:
+            worker.close()
+        else:
+            self.idle.put(worker)
+
+    def _spawn_in_background(self):
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _retire(self, worker):
+        worker.close()
+        if not self.closed:
+            self._spawn_in_background()
+
+    def run(self, code, timeout=None):
+        timeout = timeout or self.config["timeout"]
+        worker = self.idle.get(timeout=30)
+        if isinstance(worker, WorkerUnavailable):
+            if not self.closed:
+                self._spawn_in_background()  # Try the slot again for the next caller
+            raise worker
+        try:
+            worker.requests.send_bytes(code.encode(errors="replace"))
+            if not worker.responses.poll(timeout):
+                self._retire(worker)
+                return "", f"Execution timed out after {timeout} seconds."
+            output = worker.responses.recv_bytes().decode(errors="replace")
+            error = worker.responses.recv_bytes().decode(errors="replace")
+            rss_kb, dirty = (int(field) for field in worker.responses.recv_bytes().split())
+        except Exception:
+            # Whatever went wrong, the worker's state is unknown: replace it rather than reuse it
+            self._retire(worker)
+            return "", "Execution aborted: the worker exceeded its resource limits or crashed."
+        worker.runs += 1
+        if dirty or worker.runs >= self.config["max_runs"] or rss_kb > self.config["max_rss_mb"] * 1024:
+            self._retire(worker)
+        else:
+            self.idle.put(worker)
+        return output, error
+
+    def shutdown(self):
+        self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(worker, _Worker):
+                worker.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """Return the shared pool, starting its workers in the background on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def safe_execute_code(code, timeout=None):
+    # Runs in an isolated, resource-limited worker process; falls back to a one-off interpreter
+    with span("code.execute", code_chars=len(code)) as execution:
+        if resource is not None:
+            try:
+                output, error = get_worker_pool().run(code, timeout)
+                execution.set(backend="pool", output_chars=len(output), error_chars=len(error))
+                return output, error
+            except (queue.Empty, WorkerUnavailable):
+                pass
+        output, error = execute_code(code)
+        execution.set(backend="subprocess", output_chars=len(output), error_chars=len(error))
+        return output, error
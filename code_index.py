@@ -0,0 +1,250 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from ast_analysis import analyze_files
+from file_index import get_file_index
+from utils import state_path, atomic_write
+
+INDEXED_EXTENSIONS = {".py", ".js", ".jsx", ".ts", ".tsx", ".html", ".css", ".scss", ".md", ".txt", ".rst",
+                      ".json", ".toml", ".yaml", ".yml", ".cfg", ".ini", ".sh", ".go", ".rs", ".java",
+                      ".c", ".h", ".cpp", ".hpp", ".rb", ".php", ".sql"}
+MAX_FILE_BYTES = 512 * 1024
+CHUNK_LINES = 40
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text):
+    """Lowercased identifiers plus their snake_case and camelCase parts."""
+    tokens = []
+    for word in _IDENTIFIER.findall(text):
+        lowered = word.lower()
+        tokens.append(lowered)
+        parts = [part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+class CodeIndex:
+    """BM25 index over fixed-size line chunks of project files, plus a symbol table from the AST cache.
+
+    Only files whose mtime or size changed since the last update are re-chunked, and the
+    whole index is persisted under .assistant/ between sessions.
+    """
+
+    def __init__(self, root_dir=".", persist=True):
+        self.root_dir = root_dir
+        self.index_path = state_path("code_index.json", root=root_dir) if persist else None
+        self.lock = threading.Lock()
+        self.files = {}      # path -> {"mtime", "size", "chunks": [chunk ids]}
+        self.chunks = {}     # chunk id -> {"path", "start", "end", "terms": {term: tf}, "length"}
+        self.postings = {}   # term -> {chunk id: tf}
+        self.symbols = {}    # path -> [symbol dicts]
+        self.next_id = 0
+        self.total_length = 0
+        self._load()
+
+    def _load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.files = data["files"]
+        self.chunks = {int(chunk_id): chunk for chunk_id, chunk in data["chunks"].items()}
+        self.symbols = data["symbols"]
+        self.next_id = data["next_id"]
+        for chunk_id, chunk in self.chunks.items():
+            self.total_length += chunk["length"]
+            for term, tf in chunk["terms"].items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def save(self):
+        if not self.index_path:
+            return
+        data = {"files": self.files, "chunks": self.chunks, "symbols": self.symbols, "next_id": self.next_id}
+        atomic_write(self.index_path, json.dumps(data))
+
+    def _remove_file(self, path):
+        entry = self.files.pop(path, None)
+        self.symbols.pop(path, None)
+        if entry is None:
+            return
+        for chunk_id in entry["chunks"]:
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk["length"]
+            for term in chunk["terms"]:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def _add_file(self, path, stat):
+        try:
+            with open(os.path.join(self.root_dir, path), "r", errors="replace") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        chunk_ids = []
+        for start in range(0, len(lines), CHUNK_LINES):
+            terms = Counter(tokenize("".join(lines[start:start + CHUNK_LINES])))
+            if not terms:
+                continue
+            chunk_id = self.next_id
+            self.next_id += 1
+            length = sum(terms.values())
+            self.chunks[chunk_id] = {"path": path, "start": start + 1,
+                                     "end": min(start + CHUNK_LINES, len(lines)),
+                                     "terms": dict(terms), "length": length}
+            self.total_length += length
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            chunk_ids.append(chunk_id)
+        self.files[path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "chunks": chunk_ids}
+
+    def update(self):
+        """Re-index files that were added, changed or removed since the last update."""
+        index = get_file_index(self.root_dir)
+        index.refresh()
+        with self.lock:
+            current = {}
+            for path in index.iter_files():
+                if os.path.splitext(path)[1] not in INDEXED_EXTENSIONS:
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root_dir, path))
+                except OSError:
+                    continue
+                if stat.st_size <= MAX_FILE_BYTES:
+                    current[path] = stat
+            changed = [path for path, stat in current.items()
+                       if path not in self.files
+                       or (self.files[path]["mtime"], self.files[path]["size"]) != (stat.st_mtime_ns, stat.st_size)]
+            removed = [path for path in self.files if path not in current]
+            for path in removed:
+                self._remove_file(path)
+            for path in changed:
+                self._remove_file(path)
+                self._add_file(path, current[path])
+            changed_python = [path for path in changed if path.endswith(".py")]
+            if changed_python:
+                analyses = analyze_files([os.path.join(self.root_dir, path) for path in changed_python])
+                for path in changed_python:
+                    analysis = analyses.get(os.path.normpath(os.path.join(self.root_dir, path)))
+                    if analysis:
+                        self.symbols[path] = analysis["symbols"]
+            if changed or removed:
+                self.save()
+            return {"changed": len(changed), "removed": len(removed)}
+
+    def search(self, query, limit=5):
+        """Return the best matching chunks as (score, path, start, end) tuples."""
+        terms = set(tokenize(query))
+        with self.lock:
+            count = len(self.chunks)
+            if not count or not terms:
+                return []
+            average = self.total_length / count
+            scores = Counter()
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self.chunks[chunk_id]["length"]
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+            results = []
+            for chunk_id, score in scores.most_common(limit):
+                chunk = self.chunks[chunk_id]
+                results.append((score, chunk["path"], chunk["start"], chunk["end"]))
+            return results
+
+    def find_symbol(self, name, limit=20):
+        """Find definitions by exact name or qualified name, falling back to substring matches."""
+        lowered = name.lower()
+        exact, partial = [], []
+        with self.lock:
+            for path, symbols in self.symbols.items():
+                for symbol in symbols:
+                    if name in (symbol["name"], symbol["qualname"]):
+                        exact.append((path, symbol))
+                    elif lowered in symbol["qualname"].lower():
+                        partial.append((path, symbol))
+        return (exact + partial)[:limit]
+
+def _read_lines(root_dir, path, start, end, max_lines):
+    try:
+        with open(os.path.join(root_dir, path), "r", errors="replace") as f:
+            lines = f.readlines()[start - 1:min(end, start - 1 + max_lines)]
+    except OSError:
+        return ""
+    return "".join(f"{start + offset:>5}  {line}" for offset, line in enumerate(lines))
+
+def _matching_snippet(root_dir, path, start, end, terms, max_lines):
+    """Up to max_lines of the chunk start..end, centered on the lines containing query terms.
+
+    Returns (first line, last line, numbered text) for the window actually shown.
+    """
+    try:
+        with open(os.path.join(root_dir, path), "r", errors="replace") as f:
+            lines = f.readlines()[start - 1:end]
+    except OSError:
+        return start, start - 1, ""
+    hits = [offset for offset, line in enumerate(lines) if terms.intersection(tokenize(line))]
+    if hits:
+        middle = (hits[0] + hits[-1]) // 2 if hits[-1] - hits[0] < max_lines else hits[0] + max_lines // 2
+        first = min(max(middle - max_lines // 2, 0), max(len(lines) - max_lines, 0))
+    else:
+        first = 0
+    shown = lines[first:first + max_lines]
+    text = "".join(f"{start + first + offset:>5}  {line}" for offset, line in enumerate(shown))
+    return start + first, start + first + len(shown) - 1, text
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_code_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CodeIndex()
+        return _index
+
+def search_code(query, limit=5, max_lines=20):
+    """Tool entry point: targeted snippets for a free-text or identifier query."""
+    index = get_code_index()
+    index.update()
+    results = index.search(query, limit)
+    if not results:
+        return f"No matches for: {query}"
+    terms = set(tokenize(query))
+    sections = []
+    for score, path, start, end in results:
+        first, last, snippet = _matching_snippet(index.root_dir, path, start, end, terms, max_lines)
+        sections.append(f"{path}:{first}-{last} (score {score:.2f})\n{snippet}")
+    return "\n".join(sections)
+
+def find_symbol(name, limit=20, max_lines=15):
+    """Tool entry point: where a function or class is defined, with the start of its body."""
+    index = get_code_index()
+    index.update()
+    matches = index.find_symbol(name, limit)
+    if not matches:
+        return f"No symbol named: {name}"
+    sections = []
+    for path, symbol in matches:
+        header = f"{path}:{symbol['lineno']}-{symbol['end_lineno']} {symbol['kind']} {symbol['qualname']}"
+        if len(matches) <= 3:
+            header += "\n" + _read_lines(index.root_dir, path, symbol["lineno"], symbol["end_lineno"], max_lines)
+        sections.append(header)
+    return "\n".join(sections)
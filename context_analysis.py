@@ -1,27 +1,17 @@
+from ast_analysis import analyze_file
 import os
-import ast
+from dependency_graph import get_dependency_graph
+from file_index import FileIndex
 
 def analyze_project_structure(root_dir="."):
-    structure = {}
-    for root, dirs, files in os.walk(root_dir):
-        structure[root] = {"dirs": dirs, "files": files}
-    return structure
+    # One-off scan; long-lived callers should keep a FileIndex and refresh() it instead
+    index = FileIndex(root_dir, persist=False, use_inotify=False)
+    index.refresh()
+    return index.structure
 
 def analyze_file_content(file_path):
-    with open(file_path, 'r') as file:
-        content = file.read()
-
-    tree = ast.parse(content)
-    functions = [node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
-    classes = [node.name for node in ast.walk(tree) if isinstance(node, ast.ClassDef)]
-    imports = [node.names[0].name for node in ast.walk(tree) if isinstance(node, ast.Import)]
-    imports.extend([node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)])
-
-    return {
-        "functions": functions,
-        "classes": classes,
-        "imports": imports
-    }
+    # Parsed once per file version and cached; see ast_analysis
+    return analyze_file(file_path)
 
 def get_context_suggestions(project_structure, current_file):
     suggestions = []
@@ -30,4 +20,12 @@ def get_context_suggestions(project_structure, current_file):
     suggestions.append(f"Current file contains {len(file_analysis['functions'])} functions and {len(file_analysis['classes'])} classes.")
     suggestions.append(f"Imported modules: {', '.join(file_analysis['imports'])}")
 
+    graph = get_dependency_graph()
+    graph.update()
+    related = graph.related(os.path.normpath(current_file), limit=10)
+    if related:
+        described = [f"{path} ({relation} {current_file})" if distance == 1 else f"{path} ({distance} hops away)"
+                     for path, _, relation, distance in related]
+        suggestions.append("Related files: " + ", ".join(described))
+
     return suggestions
\ No newline at end of file
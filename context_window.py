@@ -0,0 +1,130 @@
+import json
+from collections import OrderedDict
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text and code
+    return max(1, len(text) // 4)
+
+def message_text(message):
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        if isinstance(block, dict):
+            parts.append(block.get("text") or json.dumps(block, default=str))
+        else:
+            parts.append(getattr(block, "text", "") or str(block))
+    return "\n".join(parts)
+
+class ContextWindow:
+    """Fits conversation history into a token budget.
+
+    The most recent turns are kept verbatim; older ones are folded into a short summary
+    prepended to the first kept user message, and anything beyond that is dropped.
+
+    The cut between summarized and kept messages only lands on a fixed grid of cumulative
+    history tokens (chunk_ratio of the budget apart). History only grows at the end, so the
+    grid never shifts: between jumps the summary and the first kept message, which start the
+    prompt-cache prefix, are identical from one turn to the next.
+    """
+
+    def __init__(self, token_budget=60000, min_recent_messages=4, summary_ratio=0.1,
+                 snippet_chars=160, counter=estimate_tokens, cache_size=10000, chunk_ratio=0.5):
+        self.token_budget = token_budget
+        self.min_recent_messages = min_recent_messages
+        self.chunk_ratio = chunk_ratio
+        self.summary_ratio = summary_ratio
+        self.snippet_chars = snippet_chars
+        self.counter = counter
+        self.cache_size = cache_size
+        self.token_cache = OrderedDict()
+        self.stats = {"requests": 0, "tokens_sent": 0, "last_request_tokens": 0,
+                      "max_request_tokens": 0, "messages_summarized": 0, "messages_dropped": 0}
+
+    def count_message(self, message):
+        content = message.get("content", "")
+        # str hashes are cached by Python, so repeat lookups for text messages are O(1)
+        key = (message.get("role"), content if isinstance(content, str) else json.dumps(content, sort_keys=True, default=str))
+        tokens = self.token_cache.get(key)
+        if tokens is None:
+            tokens = self.counter(message_text(message)) + 4  # Per-message framing overhead
+            self.token_cache[key] = tokens
+            if len(self.token_cache) > self.cache_size:
+                self.token_cache.popitem(last=False)
+        else:
+            self.token_cache.move_to_end(key)
+        return tokens
+
+    def build(self, messages, system_prompt="", tools=None):
+        """Return the messages to send, trimmed to the budget left after system prompt and tools."""
+        fixed = self.counter(system_prompt or "")
+        if tools:
+            fixed += self.counter(json.dumps(tools, default=str))
+        budget = max(self.token_budget - fixed, 0)
+
+        summary_limit = int(budget * self.summary_ratio)
+        if sum(self.count_message(message) for message in messages) > budget:
+            budget -= summary_limit  # Leave room for the summary of what gets cut
+
+        kept_tokens = 0
+        cut = len(messages)
+        while cut > 0:
+            tokens = self.count_message(messages[cut - 1])
+            if kept_tokens + tokens > budget and len(messages) - cut >= self.min_recent_messages:
+                break
+            kept_tokens += tokens
+            cut -= 1
+        if cut > 0:
+            # Advance to the next grid line so the cut stays put for the next several turns
+            step = max(int(budget * self.chunk_ratio), 1)
+            position = sum(self.count_message(message) for message in messages[:cut])
+            target = -(-position // step) * step
+            while position < target and cut < len(messages) - self.min_recent_messages:
+                position += self.count_message(messages[cut])
+                cut += 1
+        # The request has to start with a user turn
+        while cut < len(messages) - 1 and messages[cut].get("role") != "user":
+            cut += 1
+
+        older, kept = messages[:cut], list(messages[cut:])
+        # Describe the latest request's cut only; every request re-cuts the same older messages
+        self.stats["messages_summarized"] = self.stats["messages_dropped"] = 0
+        kept_tokens = sum(self.count_message(message) for message in kept)
+        summary = self.summarize(older, summary_limit) if older else ""
+        if summary and kept:
+            kept[0] = self._prepend(kept[0], summary)
+            kept_tokens += self.counter(summary)
+
+        request_tokens = fixed + kept_tokens
+        self.stats["requests"] += 1
+        self.stats["tokens_sent"] += request_tokens
+        self.stats["last_request_tokens"] = request_tokens
+        self.stats["max_request_tokens"] = max(self.stats["max_request_tokens"], request_tokens)
+        return kept
+
+    def summarize(self, messages, token_limit):
+        """Describe older turns in one line each, newest first until token_limit is reached."""
+        lines = []
+        used = 0
+        for message in reversed(messages):
+            snippet = " ".join(message_text(message).split())[:self.snippet_chars]
+            line = f"- {message.get('role')}: {snippet}"
+            tokens = self.counter(line)
+            if used + tokens > token_limit:
+                break
+            lines.append(line)
+            used += tokens
+        self.stats["messages_summarized"] = len(lines)
+        self.stats["messages_dropped"] = len(messages) - len(lines)
+        if not lines:
+            return ""
+        header = f"[Summary of {len(messages)} earlier messages, most recent first]"
+        return "\n".join([header] + lines) + "\n\n"
+
+    @staticmethod
+    def _prepend(message, text):
+        content = message.get("content", "")
+        if isinstance(content, str):
+            return {**message, "content": text + content}
+        return {**message, "content": [{"type": "text", "text": text}] + list(content)}
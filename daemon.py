@@ -0,0 +1,334 @@
+import contextvars
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from instrumentation import span, session_scope, get_tracer
+from utils import state_path, print_colored, USER_COLOR, RESULT_COLOR, Style
+
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+START_TIMEOUT = 30
+
+# The client connection a daemon thread is working for; tool threads inherit it through their context
+_channel = contextvars.ContextVar("daemon_channel", default=None)
+
+class DaemonError(Exception):
+    pass
+
+def daemon_config():
+    """Daemon settings, overridable through ASSISTANT_DAEMON_* environment variables."""
+    try:
+        idle_timeout = float(os.getenv("ASSISTANT_DAEMON_IDLE", DEFAULT_IDLE_TIMEOUT))
+    except ValueError:
+        idle_timeout = DEFAULT_IDLE_TIMEOUT
+    return {"idle_timeout": idle_timeout}
+
+def socket_path(root="."):
+    path = os.path.abspath(state_path("daemon.sock", root=root))
+    # Unix socket paths are limited to about 100 bytes; deep checkouts use a per-project temp path
+    if len(path) >= 100:
+        digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:12]
+        path = os.path.join(tempfile.gettempdir(), f"assistant-{digest}.sock")
+    return path
+
+class Channel:
+    """One client connection; output and input prompts travel over it as JSON lines."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.writer.write((json.dumps(message) + "\n").encode())
+                self.writer.flush()
+            except OSError:
+                # The client went away; the session finishes its turn without it
+                self.closed = True
+
+    def receive(self):
+        line = self.reader.readline()
+        if not line:
+            raise EOFError("client disconnected")
+        return json.loads(line)
+
+    def write(self, text):
+        self.send({"event": "output", "text": text})
+
+    def prompt(self, text=""):
+        self.send({"event": "input", "prompt": text})
+        if self.closed:
+            raise EOFError("client disconnected")
+        return self.receive().get("input", "")
+
+class RoutedOutput:
+    """sys.stdout replacement that sends what a session prints to that session's client."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        channel = _channel.get()
+        if channel is None:
+            return self.stream.write(text)
+        channel.write(text)
+        return len(text)
+
+    def flush(self):
+        if _channel.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def routed_input(prompt=""):
+    """input() for daemon sessions: asks the attached client, or the daemon's own terminal outside a session."""
+    channel = _channel.get()
+    return channel.prompt(prompt) if channel else input(prompt)
+
+class Connection:
+    def __init__(self, channel):
+        self.channel = channel
+        self.name = None
+        self.session = None
+
+class AssistantDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves CLI sessions over a Unix socket from one long-lived process.
+
+    Every session has its own CLI, model interface and conversation journal, while the file
+    index, AST and dependency caches, execution workers and HTTP connection pools are the
+    process-wide singletons, so they stay warm and are shared by all attached clients.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, session_factory, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.session_factory = session_factory
+        self.idle_timeout = idle_timeout
+        self.sessions = {}  # name -> CLI, for attached sessions only
+        self.clients = 0
+        self.lock = threading.Lock()
+        self.names = itertools.count(1)
+        self.started = time.time()
+        self.last_active = time.time()
+        self.stopping = threading.Event()
+        super().__init__(path, RequestHandler)
+
+    def rpc_attach(self, connection, session=None, model=None):
+        if connection.session is not None:
+            raise DaemonError(f"Already attached to session {connection.name}")
+        with self.lock:
+            if session in self.sessions:
+                raise DaemonError(f"Session {session} is already attached elsewhere")
+            name = session or f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self.names)}"
+            self.sessions[name] = None  # Reserved while the session is built
+        try:
+            cli = self.session_factory(name, model)
+        except Exception:
+            with self.lock:
+                del self.sessions[name]
+            raise
+        with self.lock:
+            self.sessions[name] = cli
+        connection.name, connection.session = name, cli
+        return {"session": name, "commands": list(cli.commands), "pid": os.getpid()}
+
+    def rpc_line(self, connection, text):
+        if connection.session is None:
+            raise DaemonError("Not attached to a session")
+        token = _channel.set(connection.channel)
+        try:
+            with session_scope(connection.name), span("daemon.line"):
+                return {"done": not connection.session.handle(text)}
+        finally:
+            _channel.reset(token)
+
+    def rpc_status(self, connection):
+        with self.lock:
+            return {"pid": os.getpid(), "uptime_seconds": round(time.time() - self.started, 1),
+                    "clients": self.clients, "sessions": sorted(self.sessions)}
+
+    def rpc_shutdown(self, connection):
+        self.stopping.set()
+        threading.Thread(target=self.shutdown, daemon=True).start()
+        return {"stopping": True}
+
+    def detach(self, connection):
+        if connection.name is None:
+            return
+        with self.lock:
+            cli = self.sessions.pop(connection.name, None)
+        if cli is not None:
+            cli.project_state.close()
+        get_tracer().forget(connection.name)
+
+    def watch_idle(self):
+        """Stop the daemon once no client has been connected for idle_timeout seconds."""
+        while not self.stopping.wait(min(30, max(self.idle_timeout / 4, 0.1))):
+            with self.lock:
+                idle = self.clients == 0 and time.time() - self.last_active >= self.idle_timeout
+            if idle:
+                self.stopping.set()
+                self.shutdown()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        connection = Connection(Channel(self.rfile, self.wfile))
+        with server.lock:
+            server.clients += 1
+        try:
+            while True:
+                try:
+                    request = connection.channel.receive()
+                except (EOFError, ValueError, OSError):
+                    break
+                handler = getattr(server, "rpc_" + str(request.get("method")), None)
+                try:
+                    if handler is None:
+                        raise DaemonError(f"Unknown method: {request.get('method')}")
+                    connection.channel.send({"result": handler(connection, **request.get("params", {}))})
+                except EOFError:
+                    break
+                except Exception as e:
+                    connection.channel.send({"error": f"{type(e).__name__}: {e}"})
+                if connection.channel.closed:
+                    break
+        finally:
+            server.detach(connection)
+            with server.lock:
+                server.clients -= 1
+                server.last_active = time.time()
+
+def serve(session_factory, root=".", idle_timeout=None, warm_up=None):
+    """Run the daemon in the foreground until it is idle for idle_timeout seconds or told to stop."""
+    idle_timeout = daemon_config()["idle_timeout"] if idle_timeout is None else idle_timeout
+    lock_file = open(state_path("daemon.lock", root=root), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        print_colored("An assistant daemon is already running for this project.", RESULT_COLOR)
+        return 1
+    path = socket_path(root)
+    if os.path.exists(path):
+        os.unlink(path)  # Left behind by a daemon that did not exit cleanly; the lock says it is gone
+    sys.stdout = RoutedOutput(sys.stdout)
+    server = AssistantDaemon(path, session_factory, idle_timeout)
+    os.chmod(path, 0o600)
+    if warm_up:
+        threading.Thread(target=warm_up, daemon=True).start()
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    print(f"Assistant daemon {os.getpid()} listening on {path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        for cli in list(server.sessions.values()):
+            if cli is not None:
+                cli.project_state.close()
+        os.unlink(path)
+        lock_file.close()
+    return 0
+
+class DaemonClient:
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.reader = self.socket.makefile("rb")
+        self.writer = self.socket.makefile("wb")
+
+    def call(self, method, on_output=None, on_input=None, **params):
+        """Invoke method on the daemon, handling its output and input events until the result arrives."""
+        self.writer.write((json.dumps({"method": method, "params": params}) + "\n").encode())
+        self.writer.flush()
+        while True:
+            line = self.reader.readline()
+            if not line:
+                raise DaemonError("The daemon closed the connection")
+            message = json.loads(line)
+            event = message.get("event")
+            if event == "output":
+                if on_output:
+                    on_output(message["text"])
+            elif event == "input":
+                text = on_input(message.get("prompt", "")) if on_input else ""
+                self.writer.write((json.dumps({"input": text}) + "\n").encode())
+                self.writer.flush()
+            elif "error" in message:
+                raise DaemonError(message["error"])
+            else:
+                return message.get("result")
+
+    def close(self):
+        self.socket.close()
+
+def connect(root="."):
+    """A client for the project's running daemon, or None if there is none."""
+    try:
+        return DaemonClient(socket_path(root))
+    except OSError:
+        return None
+
+def ensure_daemon(command, root=".", timeout=START_TIMEOUT):
+    """Connect to the project's daemon, starting it with command first if it isn't running."""
+    client = connect(root)
+    if client:
+        return client
+    log_path = state_path("daemon.log", root=root)
+    with open(log_path, "a") as log:
+        process = subprocess.Popen(command, cwd=root, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = connect(root)
+        if client:
+            return client
+        if process.poll() is not None and connect(root) is None:
+            with open(log_path, "r") as log:
+                tail = log.read()[-2000:].strip()
+            raise DaemonError(f"The daemon exited during startup:\n{tail}")
+        time.sleep(0.05)
+    raise DaemonError(f"The daemon did not start within {timeout} seconds; see {log_path}")
+
+def write_output(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def attach(command, session=None, model=None, root=".", ready=None):
+    """Thin interactive client: relay lines to a daemon session and print what it streams back."""
+    client = ensure_daemon(command, root)
+    try:
+        info = client.call("attach", session=session, model=model)
+        print_colored(f"Attached to session {info['session']} (daemon pid {info['pid']}).", RESULT_COLOR)
+        if ready:
+            ready()
+        try:
+            import readline
+            commands = info["commands"]
+            readline.set_completer(lambda text, state: ([cmd for cmd in commands if cmd.startswith(text)] + [None])[state])
+            readline.parse_and_bind("tab: complete")
+        except ImportError:
+            pass
+        while True:
+            try:
+                user_input = input(f"\n{USER_COLOR}You: {Style.RESET_ALL}")
+            except EOFError:
+                user_input = "exit"
+            result = client.call("line", on_output=write_output, on_input=input, text=user_input)
+            if result["done"]:
+                return 0
+    finally:
+        client.close()
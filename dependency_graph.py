@@ -0,0 +1,245 @@
+import os
+import re
+import threading
+from collections import deque
+from ast_analysis import analyze_files
+from file_index import get_file_index
+
+# Relative weight of a file that the focus imports versus one that imports the focus
+DEPENDENCY_WEIGHT = 1.0
+DEPENDENT_WEIGHT = 0.7
+SOURCE_ROOTS = ("src", "lib")
+
+def module_names(path):
+    """Dotted module names a project-relative .py path can be imported as."""
+    parts = path.replace(os.sep, "/")[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts:
+        return []
+    names = [".".join(parts)]
+    if len(parts) > 1 and parts[0] in SOURCE_ROOTS:
+        names.append(".".join(parts[1:]))
+    return names
+
+class DependencyGraph:
+    """Import edges between project files, kept in both directions and updated incrementally.
+
+    Only files whose mtime or size changed are re-analyzed (through the shared AST cache);
+    edges are re-resolved for every file only when the set of project modules changes.
+    """
+
+    def __init__(self, root_dir="."):
+        self.root_dir = root_dir
+        self.lock = threading.RLock()
+        self.files = {}         # path -> (mtime, size)
+        self.imports = {}       # path -> import_details from the AST analysis
+        self.definitions = {}   # path -> top-level definitions
+        self.docstrings = {}    # path -> module docstring
+        self.modules = {}       # dotted name -> path
+        self.forward = {}       # path -> paths it imports
+        self.reverse = {}       # path -> paths that import it
+
+    def update(self):
+        index = get_file_index(self.root_dir)
+        index.refresh()
+        with self.lock:
+            current = {}
+            for path in index.iter_files(".py"):
+                try:
+                    stat = os.stat(os.path.join(self.root_dir, path))
+                except OSError:
+                    continue
+                current[path] = (stat.st_mtime_ns, stat.st_size)
+            changed = [path for path, signature in current.items() if self.files.get(path) != signature]
+            removed = [path for path in self.files if path not in current]
+            if not changed and not removed:
+                return {"changed": 0, "removed": 0}
+            for path in removed:
+                for table in (self.files, self.imports, self.definitions, self.docstrings):
+                    table.pop(path, None)
+            analyses = analyze_files([os.path.join(self.root_dir, path) for path in changed]) if changed else {}
+            for path in changed:
+                analysis = analyses.get(os.path.normpath(os.path.join(self.root_dir, path)))
+                self.files[path] = current[path]
+                self.imports[path] = analysis["import_details"] if analysis else []
+                self.definitions[path] = analysis["definitions"] if analysis else []
+                self.docstrings[path] = analysis["docstring"] if analysis else None
+            modules = {name: path for path in self.files for name in module_names(path)}
+            if modules != self.modules:
+                self.modules = modules
+                self.forward, self.reverse = {}, {}
+                stale = list(self.files)
+            else:
+                stale = changed + removed
+            for path in stale:
+                self._unlink(path)
+                if path in self.files:
+                    self._link(path)
+            return {"changed": len(changed), "removed": len(removed)}
+
+    def _unlink(self, path):
+        for target in self.forward.pop(path, ()):
+            self.reverse.get(target, set()).discard(path)
+
+    def _link(self, path):
+        targets = set()
+        for detail in self.imports.get(path, []):
+            targets.update(self._resolve(path, detail))
+        targets.discard(path)
+        self.forward[path] = targets
+        for target in targets:
+            self.reverse.setdefault(target, set()).add(path)
+
+    def _resolve(self, path, detail):
+        """Project files an import refers to: the module itself, or submodules named in a from-import."""
+        module = detail["module"]
+        if detail["level"]:
+            package = module_names(path)[0].split(".") if module_names(path) else []
+            if not path.endswith("__init__.py"):
+                package = package[:-1]
+            package = package[:len(package) - (detail["level"] - 1)] if detail["level"] > 1 else package
+            module = ".".join(package + ([module] if module else []))
+        resolved = []
+        for name in detail["names"]:
+            submodule = f"{module}.{name}" if module else name
+            if submodule in self.modules:
+                resolved.append(self.modules[submodule])
+        parts = module.split(".") if module else []
+        # import a.b.c depends on the deepest project module along the dotted path
+        while parts:
+            candidate = ".".join(parts)
+            if candidate in self.modules:
+                resolved.append(self.modules[candidate])
+                break
+            parts.pop()
+        return resolved
+
+    def related(self, path, hops=2, limit=20):
+        """Files within hops import edges of path, as (path, score, relation, distance) sorted by score.
+
+        relation describes the neighbor from the first edge out of path ("imported by" for a
+        dependency, "imports" for a dependent). Closer files score higher, and a file's
+        dependencies rank above its dependents.
+        """
+        with self.lock:
+            if path not in self.files:
+                return []
+            best = {}
+            queue = deque([(path, 0, 1.0, None)])
+            seen = {path: 0}
+            while queue:
+                current, depth, weight, relation = queue.popleft()
+                if depth == hops:
+                    continue
+                edges = ((self.forward.get(current, ()), DEPENDENCY_WEIGHT, "imported by"),
+                         (self.reverse.get(current, ()), DEPENDENT_WEIGHT, "imports"))
+                for neighbors, edge_weight, edge_relation in edges:
+                    for neighbor in neighbors:
+                        score = weight * edge_weight / (depth + 1)
+                        label = relation or edge_relation
+                        if neighbor != path and score > best.get(neighbor, (0,))[0]:
+                            best[neighbor] = (score, label, depth + 1)
+                        if seen.get(neighbor, hops + 1) > depth + 1:
+                            seen[neighbor] = depth + 1
+                            queue.append((neighbor, depth + 1, weight * edge_weight, label))
+            ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[0]))
+            return [(neighbor, score, relation, distance) for neighbor, (score, relation, distance) in ranked[:limit]]
+
+    def find_paths(self, text):
+        """Project files mentioned in text by path, file name or module name.
+
+        Bare words only count as module names when they look like identifiers (contain "_" or
+        "."), so everyday words that happen to name a module don't pull in context.
+        """
+        with self.lock:
+            found = []
+            for token in re.findall(r"[\w./\\-]+", text):
+                token = token.strip("./\\")
+                candidates = [token] if token in self.files else []
+                if "_" in token or "." in token:
+                    candidates += [path for path in [self.modules.get(token)] if path]
+                if not candidates and token.endswith(".py"):
+                    candidates = [path for path in self.files if os.path.basename(path) == token]
+                for candidate in candidates:
+                    if candidate not in found:
+                        found.append(candidate)
+            return found
+
+    def summary(self, path, max_definitions=12):
+        """A few lines describing a file: its docstring and top-level signatures."""
+        lines = []
+        docstring = (self.docstrings.get(path) or "").strip().splitlines()
+        if docstring:
+            lines.append(f"  {docstring[0]}")
+        definitions = self.definitions.get(path, [])
+        for definition in definitions[:max_definitions]:
+            if definition["kind"] == "class":
+                bases = f"({', '.join(definition['bases'])})" if definition.get("bases") else ""
+                lines.append(f"  class {definition['name']}{bases}")
+            else:
+                lines.append(f"  def {definition['name']}({', '.join(definition.get('args', []))})")
+        if len(definitions) > max_definitions:
+            lines.append(f"  ... {len(definitions) - max_definitions} more definitions")
+        return "\n".join(lines)
+
+class RelatedContext:
+    """Builds a ranked, size-bounded description of the files around the ones a request is about."""
+
+    def __init__(self, graph, max_chars=4000, hops=2, max_files=8):
+        self.graph = graph
+        self.max_chars = max_chars
+        self.hops = hops
+        self.max_files = max_files
+        self.recent = deque(maxlen=4)
+
+    def note_paths(self, paths):
+        """Remember files the assistant just worked on, as focus for the next request."""
+        for path in paths:
+            path = os.path.relpath(path, self.graph.root_dir) if os.path.isabs(path) else os.path.normpath(path)
+            if path in self.recent:
+                self.recent.remove(path)
+            self.recent.append(path)
+
+    def __call__(self, user_input):
+        self.graph.update()
+        focus = self.graph.find_paths(user_input)
+        focus += [path for path in reversed(self.recent) if path in self.graph.files and path not in focus]
+        if not focus or self.max_chars <= 0:
+            return ""
+        candidates = {}
+        for rank, path in enumerate(focus):
+            # Files named in the request outrank the neighborhoods of earlier ones
+            for neighbor, score, relation, distance in self.graph.related(path, self.hops, self.max_files * 2):
+                if neighbor in focus:
+                    continue
+                score /= rank + 1
+                if score > candidates.get(neighbor, (0,))[0]:
+                    hops = f", {distance} hops away" if distance > 1 else ""
+                    candidates[neighbor] = (score, f"{relation} {path}{hops}")
+        sections = []
+        used = 0
+        for path in focus[:self.max_files]:
+            sections.append(f"{path} (focus)\n{self.graph.summary(path)}".rstrip())
+        ranked = sorted(candidates.items(), key=lambda item: -item[1][0])
+        for path, (score, relation) in ranked[:max(0, self.max_files - len(sections))]:
+            sections.append(f"{path} ({relation})\n{self.graph.summary(path)}".rstrip())
+        kept = []
+        for section in sections:
+            if used + len(section) > self.max_chars:
+                break
+            kept.append(section)
+            used += len(section) + 1
+        if not kept:
+            return ""
+        return "<related_files>\n" + "\n".join(kept) + "\n</related_files>"
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def get_dependency_graph(root_dir="."):
+    key = os.path.abspath(root_dir)
+    with _graphs_lock:
+        if key not in _graphs:
+            _graphs[key] = DependencyGraph(root_dir)
+        return _graphs[key]
@@ -1,42 +1,132 @@
-import ast
+import hashlib
+import json
 import os
+from ast_analysis import analyze_file, analyze_files
+from file_index import get_file_index
+from utils import state_path, atomic_write
 
-def generate_function_docs(func_node):
-    doc = f"def {func_node.name}({', '.join([a.arg for a in func_node.args.args])}):\\n"
-    if func_node.body and isinstance(func_node.body[0], ast.Expr) and isinstance(func_node.body[0].value, ast.Str):
-        doc += f"    \\\"\\\"\\\"{func_node.body[0].value.s}\\\"\\\"\\\"\n"
-    else:
-        doc += f"    \\\"\\\"\\\"TODO: Add function description\\\"\\\"\\\"\n"
+# Modules analyzed per batch, which bounds how much is held in memory at once
+DOCS_BATCH_SIZE = 256
+
+def generate_function_docs(definition):
+    doc = f"def {definition['name']}({', '.join(definition['args'])}):\n"
+    docstring = definition["docstring"] or "TODO: Add function description"
+    doc += f'    """{docstring}"""\n'
     return doc
 
-def generate_class_docs(class_node):
-    doc = f"class {class_node.name}:\\n"
-    if class_node.body and isinstance(class_node.body[0], ast.Expr) and isinstance(class_node.body[0].value, ast.Str):
-        doc += f"    \\\"\\\"\\\"{class_node.body[0].value.s}\\\"\\\"\\\"\n"
-    else:
-        doc += f"    \\\"\\\"\\\"TODO: Add class description\\\"\\\"\\\"\n"
+def generate_class_docs(definition):
+    doc = f"class {definition['name']}:\n"
+    docstring = definition["docstring"] or "TODO: Add class description"
+    doc += f'    """{docstring}"""\n'
     return doc
 
+def format_module_docs(file_path, analysis):
+    parts = [f"# {os.path.basename(file_path)}\n\n"]
+    for definition in analysis["definitions"]:
+        if definition["kind"] == "function":
+            parts.append(generate_function_docs(definition) + "\n")
+        else:
+            parts.append(generate_class_docs(definition) + "\n")
+    return "".join(parts)
+
 def generate_module_docs(file_path):
-    with open(file_path, 'r') as file:
-        content = file.read()
+    return format_module_docs(file_path, analyze_file(file_path))
+
+class DocsManifest:
+    """Content hashes of documented modules plus their cached doc fragments."""
+
+    def __init__(self):
+        self.path = state_path("docs_manifest.json")
+        self.fragment_dir = os.path.dirname(state_path("docs", "fragment"))
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _fragment_path(self, file_path):
+        return os.path.join(self.fragment_dir, hashlib.sha1(file_path.encode()).hexdigest()[:16] + ".md")
+
+    def cached_fragment(self, file_path):
+        """Return the stored docs for file_path if its source is unchanged, else None."""
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+            if (entry["mtime"], entry["size"]) != (stat.st_mtime_ns, stat.st_size):
+                with open(file_path, "rb") as f:
+                    if hashlib.sha1(f.read()).hexdigest() != entry["hash"]:
+                        return None
+                entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            with open(self._fragment_path(file_path), "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, file_path, fragment):
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        with open(self._fragment_path(file_path), "w") as f:
+            f.write(fragment)
+        self.entries[file_path] = {"hash": digest, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    def prune(self, file_paths):
+        for file_path in set(self.entries) - set(file_paths):
+            del self.entries[file_path]
+            try:
+                os.unlink(self._fragment_path(file_path))
+            except OSError:
+                pass
+
+    def save(self):
+        atomic_write(self.path, json.dumps(self.entries))
 
-    tree = ast.parse(content)
-    docs = f"# {os.path.basename(file_path)}\\n\\n"
+def list_python_files(root_dir="."):
+    # The file index skips .git, virtualenvs and anything in .gitignore
+    index = get_file_index(root_dir)
+    index.refresh()
+    return sorted(os.path.join(root_dir, path) for path in index.iter_files(".py"))
 
-    for node in ast.iter_child_nodes(tree):
-        if isinstance(node, ast.FunctionDef):
-            docs += generate_function_docs(node) + "\\n"
-        elif isinstance(node, ast.ClassDef):
-            docs += generate_class_docs(node) + "\\n"
+def iter_project_docs(root_dir=".", manifest=None, stats=None):
+    """Yield the project documentation piece by piece, regenerating only modules that changed."""
+    manifest = manifest or DocsManifest()
+    stats = stats if stats is not None else {}
+    stats.update(modules=0, regenerated=0, reused=0)
+    paths = list_python_files(root_dir)
+    yield "# Project Documentation\n\n"
+    for start in range(0, len(paths), DOCS_BATCH_SIZE):
+        batch = paths[start:start + DOCS_BATCH_SIZE]
+        fragments = {path: manifest.cached_fragment(path) for path in batch}
+        changed = [path for path, fragment in fragments.items() if fragment is None]
+        # Changed modules in a batch are parsed together so they can share a process pool
+        analyses = analyze_files(changed) if changed else {}
+        for path in batch:
+            fragment = fragments[path]
+            if fragment is None:
+                analysis = analyses.get(os.path.normpath(path))
+                if analysis is None:
+                    continue
+                fragment = format_module_docs(path, analysis) + "\n"
+                manifest.store(path, fragment)
+                stats["regenerated"] += 1
+            else:
+                stats["reused"] += 1
+            stats["modules"] += 1
+            yield fragment
+    manifest.prune(paths)
+    manifest.save()
 
-    return docs
+def write_project_docs(output_path="project_documentation.md", root_dir="."):
+    """Stream the documentation to output_path and return counts of modules regenerated and reused."""
+    stats = {}
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "w") as f:
+        for chunk in iter_project_docs(root_dir, stats=stats):
+            f.write(chunk)
+    os.replace(temp_path, output_path)
+    return stats
 
 def generate_project_docs(root_dir="."):
-    docs = "# Project Documentation\\n\\n"
-    for root, dirs, files in os.walk(root_dir):
-        for file in files:
-            if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                docs += generate_module_docs(file_path) + "\\n"
-    return docs
\ No newline at end of file
+    return "".join(iter_project_docs(root_dir))
@@ -0,0 +1,315 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import os
+import struct
+import threading
+from utils import state_path, atomic_write
+
+# Always skipped, whether or not the project has a .gitignore
+DEFAULT_IGNORES = [".git/", "__pycache__/", ".assistant/", "*.pyc", ".venv/", "venv/", "node_modules/",
+                   ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", ".tox/"]
+
+class IgnoreRules:
+    """A small subset of .gitignore semantics: globs, negation, anchoring and dir-only patterns."""
+
+    def __init__(self, patterns=()):
+        self.rules = []
+        self.loaded_files = set()
+        self.add_patterns("", patterns)
+
+    def add_patterns(self, base, patterns):
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            self.rules.append((base, line.lstrip("/"), negate, dir_only, anchored))
+
+    def add_file(self, base, path):
+        if path in self.loaded_files:
+            return
+        self.loaded_files.add(path)
+        try:
+            with open(path, "r") as f:
+                self.add_patterns(base, f.read().splitlines())
+        except OSError:
+            pass
+
+    def is_ignored(self, rel_path, is_dir):
+        ignored = False
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                candidate = rel_path[len(base) + 1:]
+            else:
+                candidate = rel_path
+            target = candidate if anchored else candidate.rsplit("/", 1)[-1]
+            if fnmatch.fnmatchcase(target, pattern):
+                ignored = not negate
+        return ignored
+
+class _Inotify:
+    """Minimal ctypes binding used to mark directories dirty without polling them."""
+
+    MASK = 0x00000100 | 0x00000200 | 0x00000040 | 0x00000080 | 0x00000400 | 0x00000800  # create/delete/move/self
+    IN_NONBLOCK = 0o4000
+    IN_Q_OVERFLOW = 0x00004000
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.paths = {}
+
+    def watch(self, path):
+        if path in self.paths:
+            return True
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            return False
+        self.watches[wd] = path
+        self.paths[path] = wd
+        return True
+
+    def unwatch(self, path):
+        wd = self.paths.pop(path, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_dirty(self):
+        """Return the set of watched paths with pending events, or None on queue overflow."""
+        dirty = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return dirty
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = struct.unpack_from("iIII", data, offset)
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    return None
+                if wd in self.watches:
+                    dirty.add(self.watches[wd])
+
+    def close(self):
+        os.close(self.fd)
+
+class FileIndex:
+    """Persistent directory snapshot that is refreshed incrementally.
+
+    Each known directory is stored with its mtime; a refresh only re-lists directories whose
+    mtime changed (or that inotify reported), so the cost follows what changed rather than
+    the size of the tree.
+    """
+
+    def __init__(self, root_dir=".", persist=True, use_inotify=True):
+        self.root_dir = root_dir
+        self.persist = persist
+        self.snapshot_path = state_path("file_index.json", root=root_dir) if persist else None
+        self.lock = threading.RLock()
+        self.dirs = {}
+        self.structure = {}
+        self.ignore_rules = None
+        self.ignore_mtimes = {}
+        self.inotify = None
+        self.inotify_ready = False
+        if use_inotify:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError):
+                self.inotify = None
+        self._load_snapshot()
+
+    def _abs(self, rel_dir):
+        return os.path.join(self.root_dir, rel_dir) if rel_dir else self.root_dir
+
+    def _load_snapshot(self):
+        if not self.persist or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.dirs = snapshot.get("dirs", {})
+        self.ignore_mtimes = snapshot.get("ignore_mtimes", {})
+        self._load_ignore_rules()
+        self.structure = {self._abs(rel): {"dirs": entry["dirs"], "files": entry["files"]}
+                          for rel, entry in self.dirs.items()}
+
+    def save(self):
+        if not self.persist:
+            return
+        with self.lock:
+            snapshot = {"dirs": self.dirs, "ignore_mtimes": self.ignore_mtimes}
+            atomic_write(self.snapshot_path, json.dumps(snapshot))
+
+    def _ignore_files(self):
+        files = {"": [os.path.join(self.root_dir, ".gitignore"),
+                      os.path.join(self.root_dir, ".git", "info", "exclude")]}
+        for rel, entry in self.dirs.items():
+            if rel and ".gitignore" in entry["files"]:
+                files.setdefault(rel, []).append(os.path.join(self._abs(rel), ".gitignore"))
+        return files
+
+    def _ignore_mtimes_now(self):
+        mtimes = {}
+        for paths in self._ignore_files().values():
+            for path in paths:
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+        return mtimes
+
+    def _load_ignore_rules(self):
+        rules = IgnoreRules(DEFAULT_IGNORES)
+        for base, paths in sorted(self._ignore_files().items()):
+            for path in paths:
+                rules.add_file(base, path)
+        self.ignore_rules = rules
+
+    def _scan_dir(self, rel_dir, changes):
+        """List one directory, record it, and recurse into subdirectories not yet known."""
+        path = self._abs(rel_dir)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError:
+            self._drop_dir(rel_dir, changes)
+            return
+        if rel_dir and any(entry.name == ".gitignore" for entry in entries):
+            self.ignore_rules.add_file(rel_dir, os.path.join(path, ".gitignore"))
+        dirs, files = [], []
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if self.ignore_rules.is_ignored(rel, is_dir):
+                continue
+            (dirs if is_dir else files).append(entry.name)
+
+        previous = self.dirs.get(rel_dir)
+        if previous is not None:
+            old_files, new_files = set(previous["files"]), set(files)
+            changes["added"].extend(self._join(rel_dir, name) for name in new_files - old_files)
+            changes["removed"].extend(self._join(rel_dir, name) for name in old_files - new_files)
+            for name in set(previous["dirs"]) - set(dirs):
+                self._drop_dir(self._join(rel_dir, name), changes)
+        else:
+            changes["added"].extend(self._join(rel_dir, name) for name in files)
+
+        self.dirs[rel_dir] = {"mtime": mtime, "dirs": dirs, "files": files}
+        self.structure[self._abs(rel_dir)] = {"dirs": dirs, "files": files}
+        if self.inotify and not self.inotify.watch(path):
+            # Out of watches: fall back to mtime polling for the whole tree
+            self.inotify.close()
+            self.inotify = None
+        for name in dirs:
+            child = self._join(rel_dir, name)
+            if child not in self.dirs:
+                self._scan_dir(child, changes)
+
+    def _drop_dir(self, rel_dir, changes):
+        entry = self.dirs.pop(rel_dir, None)
+        self.structure.pop(self._abs(rel_dir), None)
+        if entry is None:
+            return
+        if self.inotify:
+            self.inotify.unwatch(self._abs(rel_dir))
+        changes["removed"].extend(self._join(rel_dir, name) for name in entry["files"])
+        for name in entry["dirs"]:
+            self._drop_dir(self._join(rel_dir, name), changes)
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return f"{rel_dir}/{name}" if rel_dir else name
+
+    def _full_scan(self, changes):
+        old_files = set(self.iter_files())
+        self.dirs = {}
+        self.structure = {}
+        self._scan_dir("", {"added": [], "removed": []})
+        new_files = set(self.iter_files())
+        changes["added"].extend(sorted(new_files - old_files))
+        changes["removed"].extend(sorted(old_files - new_files))
+
+    def refresh(self):
+        """Bring the index up to date and return the files added/removed since the last refresh."""
+        with self.lock:
+            changes = {"added": [], "removed": []}
+            ignore_mtimes = self._ignore_mtimes_now()
+            if not self.dirs or ignore_mtimes != self.ignore_mtimes or self.ignore_rules is None:
+                self.ignore_mtimes = ignore_mtimes
+                self._load_ignore_rules()
+                self._full_scan(changes)
+                self.ignore_mtimes = self._ignore_mtimes_now()
+                self.inotify_ready = self.inotify is not None
+            else:
+                for rel_dir in self._dirty_dirs():
+                    if rel_dir in self.dirs:
+                        self._scan_dir(rel_dir, changes)
+            if changes["added"] or changes["removed"]:
+                self.save()
+            return changes
+
+    def _dirty_dirs(self):
+        if self.inotify and self.inotify_ready:
+            dirty_paths = self.inotify.read_dirty()
+            if dirty_paths is not None:
+                by_path = {self._abs(rel): rel for rel in self.dirs}
+                return sorted((by_path[p] for p in dirty_paths if p in by_path), key=len)
+        if self.inotify:
+            # Watch everything before polling so no change slips between the two
+            for rel_dir in list(self.dirs):
+                if not self.inotify.watch(self._abs(rel_dir)):
+                    self.inotify.close()
+                    self.inotify = None
+                    break
+            self.inotify_ready = self.inotify is not None
+        dirty = []
+        for rel_dir, entry in list(self.dirs.items()):
+            try:
+                if os.stat(self._abs(rel_dir)).st_mtime_ns != entry["mtime"]:
+                    dirty.append(rel_dir)
+            except OSError:
+                dirty.append(rel_dir)
+        return sorted(dirty, key=len)
+
+    def iter_files(self, suffix=None):
+        """Yield project-relative paths of every indexed file, optionally filtered by suffix."""
+        for rel_dir, entry in list(self.dirs.items()):
+            for name in entry["files"]:
+                if suffix is None or name.endswith(suffix):
+                    yield self._join(rel_dir, name)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_file_index(root_dir="."):
+    """Shared FileIndex per root, so every feature reuses one snapshot and one set of watches."""
+    key = os.path.abspath(root_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = FileIndex(root_dir)
+        return _indexes[key]
@@ -1,4 +1,20 @@
+import bisect
+import mmap
 import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from instrumentation import add
+from utils import atomic_write
+
+# Hard cap on what a single read returns, so large files can't flood memory or the context
+MAX_READ_BYTES = 64 * 1024
+MAX_GREP_MATCHES = 200
+LINE_INDEX_CACHE_SIZE = 32
+
+class EditError(Exception):
+    pass
 
 def create_folder(path):
     try:
@@ -11,23 +27,152 @@ def create_file(path, content=""):
     try:
         with open(path, 'w') as f:
             f.write(content)
+        add("bytes_written", len(content.encode('utf-8')))
         return f"File created: {path}"
     except Exception as e:
         return f"Error creating file: {str(e)}"
 
 def write_to_file(path, content):
     try:
-        with open(path, 'w') as f:
-            f.write(content)
+        atomic_write(path, content)
+        add("bytes_written", len(content.encode('utf-8')))
         return f"Content written to file: {path}"
     except Exception as e:
         return f"Error writing to file: {str(e)}"
 
-def read_file(path):
+class _LineIndexCache:
+    """Byte offsets of line starts per file, reused until the file's mtime or size changes."""
+
+    def __init__(self, max_entries=LINE_INDEX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, stat, data):
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(key)
+                return entry[1]
+        offsets = array('q', [0])
+        position = data.find(b"\n")
+        while position != -1:
+            offsets.append(position + 1)
+            position = data.find(b"\n", position + 1)
+        if offsets[-1] == len(data) and len(offsets) > 1:
+            offsets.pop()  # A trailing newline doesn't start another line
+        with self.lock:
+            self.entries[key] = ((stat.st_mtime_ns, stat.st_size), offsets)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return offsets
+
+_line_indexes = _LineIndexCache()
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
+
+def _cap(text, max_bytes, hint):
+    """Cut text to max_bytes at a line boundary and say what was left out."""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    cut = encoded.rfind(b"\n", 0, max_bytes) + 1 or max_bytes
+    return _decode(encoded[:cut]) + f"\n[... truncated: showing {cut} of {len(encoded)} bytes; {hint} ...]"
+
+def _grep(data, offsets, path, pattern, context, max_bytes):
     try:
-        with open(path, 'r') as f:
-            content = f.read()
-        return content
+        regex = re.compile(pattern.encode('utf-8'))
+    except re.error as e:
+        return f"Error reading file: invalid pattern: {e}"
+    line_count = len(offsets)
+    selected, matches = [], 0
+    for match in regex.finditer(data):
+        line = bisect.bisect_right(offsets, match.start()) - 1
+        if selected and selected[-1][1] >= line:
+            continue
+        matches += 1
+        if matches > MAX_GREP_MATCHES:
+            break
+        first, last = max(0, line - context), min(line_count - 1, line + context)
+        if selected and first <= selected[-1][1] + 1:
+            selected[-1][1] = last
+        else:
+            selected.append([first, last])
+    if not selected:
+        return f"No matches for {pattern!r} in {path}"
+    parts = []
+    for first, last in selected:
+        if parts:
+            parts.append("--\n")
+        for line in range(first, last + 1):
+            end = offsets[line + 1] if line + 1 < line_count else len(data)
+            text = _decode(data[offsets[line]:end]).rstrip("\r\n")
+            parts.append(f"{line + 1}: {text}\n")
+    output = "".join(parts)
+    if matches > MAX_GREP_MATCHES:
+        output += f"[... stopped after {MAX_GREP_MATCHES} matches ...]"
+    return _cap(output, max_bytes, "narrow the pattern")
+
+def read_file(path, start_line=None, end_line=None, head=None, tail=None, offset=None, length=None,
+              grep=None, context=0, max_bytes=MAX_READ_BYTES):
+    """Read all or part of a file without loading more of it than the answer needs.
+
+    Ranges can be given as 1-based inclusive lines, the first/last N lines, a byte offset
+    and length, or a regex to grep for (with optional lines of context). The file is
+    memory-mapped and its line offsets cached, so repeated reads of a large file only touch
+    the pages they return. Output is capped at max_bytes with a truncation marker.
+    """
+    text = _read_part(path, start_line, end_line, head, tail, offset, length, grep, context, max_bytes)
+    add("bytes_read", len(text.encode('utf-8')))
+    return text
+
+def _read_part(path, start_line, end_line, head, tail, offset, length, grep, context, max_bytes):
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            if stat.st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                size = len(data)
+                if offset is not None or length is not None:
+                    start = max(0, offset or 0)
+                    end = size if length is None else min(size, start + max(0, length))
+                    text = _decode(data[start:min(end, start + max_bytes)])
+                    if end - start > max_bytes:
+                        text += (f"\n[... truncated: showing bytes {start}-{start + max_bytes} of {size}; "
+                                 f"continue with offset={start + max_bytes} ...]")
+                    return text
+                if grep is None and start_line is None and end_line is None and head is None and tail is None:
+                    if size <= max_bytes:
+                        return _decode(data[:])
+                    cut = data.rfind(b"\n", 0, max_bytes) + 1 or max_bytes
+                    return (_decode(data[:cut]) + f"\n[... truncated: showing {cut} of {size} bytes; "
+                            f"use start_line/end_line, tail or grep to read the rest ...]")
+                offsets = _line_indexes.get(path, stat, data)
+                line_count = len(offsets)
+                if grep is not None:
+                    return _grep(data, offsets, path, grep, max(0, context), max_bytes)
+                if head is not None:
+                    first, last = 1, head
+                elif tail is not None:
+                    first, last = line_count - tail + 1, line_count
+                else:
+                    first, last = start_line or 1, end_line or line_count
+                first, last = max(1, first), min(line_count, last)
+                if first > last:
+                    return f"[no lines in range; {path} has {line_count} lines]"
+                end = offsets[last] if last < line_count else size
+                start = offsets[first - 1]
+                if end - start > max_bytes:
+                    cut = data.rfind(b"\n", start, start + max_bytes) + 1 or start + max_bytes
+                    shown = bisect.bisect_right(offsets, cut - 1)
+                    return (_decode(data[start:cut]) + f"\n[... truncated: showing lines {first}-{shown} of "
+                            f"{line_count}; continue with start_line={shown + 1} ...]")
+                header = "" if (first, last) == (1, line_count) else f"[lines {first}-{last} of {line_count}]\n"
+                return header + _decode(data[start:end])
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
@@ -36,4 +181,219 @@ def list_files(path="."):
         files = os.listdir(path)
         return "\n".join(files)
     except Exception as e:
-        return f"Error listing files: {str(e)}"
\ No newline at end of file
+        return f"Error listing files: {str(e)}"
+
+def _read_text(path):
+    try:
+        with open(path, 'r', newline='') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise EditError(f"File not found: {path}")
+
+def _commit(changes):
+    """Write every changed file atomically, restoring the originals if any write fails."""
+    originals = {}
+    try:
+        for path, content in changes.items():
+            originals[path] = _read_text(path) if os.path.exists(path) else None
+            if content is None:
+                os.unlink(path)
+            else:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                atomic_write(path, content)
+                add("bytes_written", len(content.encode('utf-8')))
+    except Exception:
+        for path, original in originals.items():
+            if original is None:
+                if os.path.exists(path):
+                    os.unlink(path)
+            else:
+                atomic_write(path, original)
+        raise
+
+def _replace_text(content, path, old, new, replace_all=False):
+    count = content.count(old) if old else 0
+    if count == 0:
+        raise EditError(f"Text to replace not found in {path}")
+    if count > 1 and not replace_all:
+        raise EditError(f"Text to replace matches {count} times in {path}; include more context or set replace_all")
+    return content.replace(old, new) if replace_all else content.replace(old, new, 1)
+
+def _replace_lines(content, path, start_line, end_line, new_content):
+    lines = content.splitlines(keepends=True)
+    if start_line < 1 or end_line < start_line - 1 or start_line > len(lines) + 1:
+        raise EditError(f"Line range {start_line}-{end_line} is outside {path} ({len(lines)} lines)")
+    if new_content and not new_content.endswith("\n"):
+        new_content += "\n"
+    lines[start_line - 1:end_line] = [new_content] if new_content else []
+    return "".join(lines)
+
+def str_replace(path, old, new, replace_all=False):
+    try:
+        _commit({path: _replace_text(_read_text(path), path, old, new, replace_all)})
+        return f"Replaced text in {path}"
+    except Exception as e:
+        return f"Error editing file: {str(e)}"
+
+def edit_lines(path, start_line, end_line, content):
+    """Replace lines start_line..end_line (1-based, inclusive); end_line = start_line - 1 inserts."""
+    try:
+        _commit({path: _replace_lines(_read_text(path), path, start_line, end_line, content)})
+        return f"Edited lines {start_line}-{end_line} of {path}"
+    except Exception as e:
+        return f"Error editing file: {str(e)}"
+
+def batch_edit(edits):
+    """Apply several str_replace/edit_lines edits across files; nothing is written unless all apply."""
+    try:
+        contents = {}
+        for edit in edits:
+            path = edit["path"]
+            if path not in contents:
+                contents[path] = _read_text(path)
+            if "old" in edit:
+                contents[path] = _replace_text(contents[path], path, edit["old"], edit.get("new", ""),
+                                               edit.get("replace_all", False))
+            else:
+                contents[path] = _replace_lines(contents[path], path, edit["start_line"], edit["end_line"],
+                                                edit.get("content", ""))
+        _commit(contents)
+        return f"Applied {len(edits)} edits to {len(contents)} files: {', '.join(contents)}"
+    except Exception as e:
+        return f"Error editing files: {str(e)}"
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+def _diff_path(header):
+    path = header.rstrip("\r\n").split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+def _is_file_header(lines, i):
+    return lines[i].startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ ")
+
+def parse_unified_diff(patch):
+    """Split a unified diff into [{"old", "new", "hunks": [{"old_start", "lines"}]}] per file.
+
+    Hunk bodies are read by the line counts in their @@ header, so removed and added lines that
+    themselves start with "--" and "++" are not mistaken for the next file's header.
+    """
+    lines = patch.splitlines(keepends=True)
+    files = []
+    current = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _is_file_header(lines, i):
+            current = {"old": _diff_path(line[4:]), "new": _diff_path(lines[i + 1][4:]), "hunks": []}
+            files.append(current)
+            i += 2
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match and current is not None:
+            hunk = {"old_start": int(match.group(1)), "lines": []}
+            old_left = int(match.group(2)) if match.group(2) is not None else 1
+            new_left = int(match.group(4)) if match.group(4) is not None else 1
+            i += 1
+            while i < len(lines):
+                body = lines[i]
+                if body.startswith("\\"):
+                    # "\ No newline at end of file" applies to the line before it
+                    if hunk["lines"]:
+                        hunk["lines"][-1] = hunk["lines"][-1].rstrip("\r\n")
+                    i += 1
+                    continue
+                if old_left <= 0 and new_left <= 0:
+                    # Counts are used up; only keep reading a miscounted hunk while it can't be a header
+                    if _HUNK_HEADER.match(body) or _is_file_header(lines, i) or body[:1] not in (" ", "-", "+"):
+                        break
+                if body[:1] == "-":
+                    old_left -= 1
+                elif body[:1] == "+":
+                    new_left -= 1
+                elif body[:1] == " " or body.strip() == "":
+                    if body[:1] != " ":
+                        body = " " + body  # Context line whose leading space was stripped
+                    old_left -= 1
+                    new_left -= 1
+                else:
+                    break
+                hunk["lines"].append(body)
+                i += 1
+            current["hunks"].append(hunk)
+            continue
+        i += 1
+    return files
+
+def _find_block(lines, block, expected, start):
+    """Locate block in lines at or after start, preferring the position closest to expected."""
+    key = [line.rstrip("\r\n") for line in block]
+    candidates = range(start, len(lines) - len(block) + 1)
+    for position in sorted(candidates, key=lambda p: abs(p - expected)):
+        if [line.rstrip("\r\n") for line in lines[position:position + len(block)]] == key:
+            return position
+    return None
+
+def _apply_hunks(content, path, hunks):
+    lines = content.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+        missing_final_newline = True
+    else:
+        missing_final_newline = False
+    offset = 0
+    position = 0
+    for number, hunk in enumerate(hunks, 1):
+        old_block = [line[1:] for line in hunk["lines"] if line[0] in " -"]
+        new_block = [line[1:] for line in hunk["lines"] if line[0] in " +"]
+        expected = max(hunk["old_start"] - 1 + offset, 0)
+        if old_block:
+            found = _find_block(lines, old_block, expected, position)
+            if found is None:
+                raise EditError(f"Hunk {number} does not apply to {path}")
+        else:
+            found = min(hunk["old_start"] + offset, len(lines)) if hunk["old_start"] else 0
+        lines[found:found + len(old_block)] = [line if line.endswith("\n") else line + "\n" for line in new_block]
+        if new_block and not new_block[-1].endswith("\n") and found + len(new_block) == len(lines):
+            missing_final_newline = True
+        elif new_block and found + len(new_block) == len(lines):
+            missing_final_newline = False
+        offset += len(new_block) - len(old_block)
+        position = found + len(new_block)
+    result = "".join(lines)
+    return result[:-1] if missing_final_newline and result.endswith("\n") else result
+
+def apply_patch(patch):
+    """Apply a unified diff touching one or more files; nothing is written unless every hunk applies."""
+    try:
+        files = parse_unified_diff(patch)
+        if not files:
+            raise EditError("No file headers (---/+++) found in patch")
+        changes = {}
+        summary = []
+        for file in files:
+            if file["new"] is None:
+                changes[file["old"]] = None
+                summary.append(f"deleted {file['old']}")
+                continue
+            source = file["old"]
+            if source is None:
+                content = ""
+            elif source in changes:
+                content = changes[source]
+            else:
+                content = _read_text(source)
+            changes[file["new"]] = _apply_hunks(content, file["new"], file["hunks"])
+            if source is not None and source != file["new"]:
+                changes[source] = None
+            action = "created" if source is None else "patched"
+            summary.append(f"{action} {file['new']} ({len(file['hunks'])} hunks)")
+        _commit(changes)
+        return "Patch applied: " + ", ".join(summary)
+    except Exception as e:
+        return f"Error applying patch: {str(e)}"
@@ -0,0 +1,198 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from utils import state_path
+
+# Durations kept per span name for percentiles; older samples are dropped
+MAX_SAMPLES = 10000
+
+_current = contextvars.ContextVar("current_span", default=None)
+# The session spans and counters are recorded for; None outside a daemon session
+_session = contextvars.ContextVar("session", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, value):
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    @property
+    def duration(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_record(self):
+        """The span in OTLP/JSON field naming, so traces can be fed to OpenTelemetry tooling."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+class Tracer:
+    """Records spans for the session's statistics and, when enabled, appends them to a JSONL trace file.
+
+    Counters added to a span (tokens, bytes, cache hits) are also summed per session, and
+    propagate up to every enclosing span so a turn's totals include its tool calls. Durations
+    and counters are kept separately for each session, so daemon sessions don't mix.
+    """
+
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        self.durations = defaultdict(lambda: defaultdict(lambda: deque(maxlen=MAX_SAMPLES)))  # session -> name
+        self.counters = defaultdict(lambda: defaultdict(float))  # session -> name
+        self.counter_names = set()
+        self.otel_tracer = None
+
+    def enable_export(self, trace_path):
+        directory = os.path.dirname(os.path.abspath(trace_path))
+        os.makedirs(directory, exist_ok=True)
+        self.trace_path = trace_path
+
+    def enable_opentelemetry(self):
+        """Mirror spans into the OpenTelemetry API if it is installed; returns whether it was."""
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            return False
+        self.otel_tracer = trace.get_tracer("assistant")
+        return True
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current.get()
+        session = _session.get()
+        if session is not None:
+            attributes.setdefault("session", session)
+        span = Span(name, parent, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def add(self, name, value):
+        """Add to a counter on the current span (and its ancestors) and to the session totals."""
+        span = _current.get()
+        with self.lock:
+            if span is not None:
+                span.add(name, value)
+            self.counters[_session.get()][name] += value
+            self.counter_names.add(name)
+
+    def _finish(self, span):
+        parent = _current.get()
+        with self.lock:
+            self.durations[_session.get()][span.name].append(span.duration)
+            if self.trace_path:
+                with open(self.trace_path, "a") as f:
+                    f.write(json.dumps(span.to_record(), default=str) + "\n")
+            # Counters roll up so an outer span reports the totals of everything inside it
+            if parent is not None:
+                for key, value in span.attributes.items():
+                    if key in self.counter_names and isinstance(value, (int, float)) and not isinstance(value, bool):
+                        parent.add(key, value)
+        if self.otel_tracer is not None:
+            otel_span = self.otel_tracer.start_span(span.name, start_time=span.start_ns,
+                                                    attributes={key: value for key, value in span.attributes.items()
+                                                                if isinstance(value, (str, int, float, bool))})
+            otel_span.end(end_time=span.end_ns)
+
+    def stats(self, session=None):
+        """Per span name: count, p50/p90/p99/max and total seconds; plus the session counters.
+
+        Covers the given session, or the current one if none is given.
+        """
+        session = session if session is not None else _session.get()
+        with self.lock:
+            spans = {}
+            for name, samples in self.durations.get(session, {}).items():
+                ordered = sorted(samples)
+                if not ordered:
+                    continue
+                spans[name] = {"count": len(ordered), "p50": percentile(ordered, 50), "p90": percentile(ordered, 90),
+                               "p99": percentile(ordered, 99), "max": ordered[-1], "total": sum(ordered)}
+            return {"spans": spans, "counters": dict(self.counters.get(session, {}))}
+
+    def forget(self, session):
+        """Drop a finished session's durations and counters."""
+        with self.lock:
+            self.durations.pop(session, None)
+            self.counters.pop(session, None)
+
+    def format_stats(self, session=None):
+        stats = self.stats(session)
+        if not stats["spans"]:
+            return "No activity recorded yet."
+        lines = [f"{'span':<24}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total s':>10}"]
+        for name, row in sorted(stats["spans"].items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{name:<24}{row['count']:>7}{row['p50'] * 1000:>10.1f}{row['p90'] * 1000:>10.1f}"
+                         f"{row['p99'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}{row['total']:>10.2f}")
+        if stats["counters"]:
+            lines.append("")
+            lines.extend(f"{name}: {value:g}" for name, value in sorted(stats["counters"].items()))
+        return "\n".join(lines)
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+_tracer = Tracer()
+
+def get_tracer():
+    return _tracer
+
+def span(name, **attributes):
+    return _tracer.span(name, **attributes)
+
+def add(name, value):
+    _tracer.add(name, value)
+
+@contextmanager
+def session_scope(name):
+    """Record spans and counters in this context (and threads copying it) under session name."""
+    token = _session.set(name)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+def configure_from_env():
+    """Export traces if ASSISTANT_TRACE names a file (or is 1, for .assistant/traces/<pid>.jsonl)."""
+    target = os.getenv("ASSISTANT_TRACE", "")
+    if target.lower() in ("1", "true", "yes", "on"):
+        target = state_path("traces", f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+    if target:
+        _tracer.enable_export(target)
+    if os.getenv("ASSISTANT_OTEL", "").lower() in ("1", "true", "yes", "on"):
+        _tracer.enable_opentelemetry()
+    return target or None
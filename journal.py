@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+from collections import deque
+from utils import state_path, atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms only get the in-process lock
+    fcntl = None
+
+class ConversationJournal:
+    """Append-only JSONL journal for conversation history.
+
+    Messages are appended to numbered segment files, so a save only writes what is new.
+    Segments are periodically folded into base.jsonl; its header records the last merged
+    segment, which keeps compaction safe if the process dies before old segments are removed.
+    """
+
+    def __init__(self, directory=None, max_segment_bytes=1 << 20, max_segments=8):
+        self.directory = directory or os.path.dirname(state_path("journal", "base.jsonl"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.base_path = os.path.join(self.directory, "base.jsonl")
+        self.lock_path = os.path.join(self.directory, ".lock")
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+
+    class _Locked:
+        def __init__(self, journal):
+            self.journal = journal
+
+        def __enter__(self):
+            self.journal.lock.acquire()
+            self.lock_file = open(self.journal.lock_path, "a")
+            if fcntl:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            return self
+
+        def __exit__(self, *exc):
+            if fcntl:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.journal.lock.release()
+
+    def locked(self):
+        """Serialize writers across threads and processes."""
+        return self._Locked(self)
+
+    def _segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".jsonl" and stem.isdigit():
+                numbers.append(int(stem))
+        return sorted(numbers)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{number:08d}.jsonl")
+
+    def _compacted_through(self):
+        try:
+            with open(self.base_path, "r") as f:
+                header = json.loads(f.readline())
+            return header["__journal__"]["through"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    @staticmethod
+    def _read_lines(path):
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # Torn write from a crash; everything before it is intact
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "__journal__" not in record:
+                        yield record
+        except FileNotFoundError:
+            return
+
+    def append(self, messages):
+        if not messages:
+            return
+        data = "".join(json.dumps(message) + "\n" for message in messages)
+        with self.locked():
+            through = self._compacted_through()
+            segments = [n for n in self._segments() if n > through]
+            number = segments[-1] if segments else through + 1
+            path = self._segment_path(number)
+            if os.path.exists(path) and os.path.getsize(path) >= self.max_segment_bytes:
+                number += 1
+                path = self._segment_path(number)
+                segments.append(number)
+            elif not segments:
+                segments.append(number)
+            self._repair_tail(path)
+            with open(path, "a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if len(segments) > self.max_segments:
+                self._compact(segments)
+
+    @staticmethod
+    def _repair_tail(path):
+        """Drop a torn trailing line so new records start on a clean line."""
+        try:
+            with open(path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return
+                f.seek(0)
+                content = f.read()
+                f.seek(content.rfind(b"\n") + 1)
+                f.truncate()
+        except FileNotFoundError:
+            pass
+
+    def compact(self):
+        with self.locked():
+            through = self._compacted_through()
+            self._compact([n for n in self._segments() if n > through])
+
+    def _compact(self, segments):
+        if not segments:
+            return
+        header = json.dumps({"__journal__": {"through": segments[-1]}}) + "\n"
+        temp_path = self.base_path + ".tmp"
+        with open(temp_path, "w") as out:
+            out.write(header)
+            for path in [self.base_path] + [self._segment_path(n) for n in segments]:
+                for record in self._read_lines(path):
+                    out.write(json.dumps(record) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, self.base_path)
+        for number in self._segments():
+            if number <= segments[-1]:
+                os.unlink(self._segment_path(number))
+
+    def rewrite(self, messages):
+        """Replace the whole journal, e.g. when history is reset or imported."""
+        with self.locked():
+            through = max([self._compacted_through()] + self._segments())
+            header = json.dumps({"__journal__": {"through": through}}) + "\n"
+            atomic_write(self.base_path, header + "".join(json.dumps(m) + "\n" for m in messages))
+            for number in self._segments():
+                os.unlink(self._segment_path(number))
+
+    def iter_messages(self):
+        """Stream every message in order without loading the journal into memory."""
+        through = self._compacted_through()
+        yield from self._read_lines(self.base_path)
+        for number in self._segments():
+            if number > through:
+                yield from self._read_lines(self._segment_path(number))
+
+    def page(self, start, stop=None):
+        """Return messages[start:stop] while only holding that page in memory."""
+        result = []
+        for index, message in enumerate(self.iter_messages()):
+            if stop is not None and index >= stop:
+                break
+            if index >= start:
+                result.append(message)
+        return result
+
+    def tail(self, count):
+        return list(deque(self.iter_messages(), maxlen=count))
+
+    def count(self):
+        return sum(1 for _ in self.iter_messages())
+
+    def is_empty(self):
+        return not os.path.exists(self.base_path) and not self._segments()
@@ -1,24 +1,99 @@
+import time
+
+STARTED = time.perf_counter()
+
 import argparse
 import os
+import sys
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from ai_interface import AIInterface
-from cli import CLI
-from project_state import ProjectState
-from utils import print_colored, CLAUDE_COLOR, USER_COLOR
+from utils import print_colored, CLAUDE_COLOR, USER_COLOR, RESULT_COLOR
 
-def main():
-    load_dotenv()
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        print_colored("Error: ANTHROPIC_API_KEY not found in environment variables.", USER_COLOR)
-        return
+class StartupProfile:
+    """Wall-clock time of each startup phase, reported with --profile-startup."""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = [("interpreter and base imports", time.perf_counter() - STARTED)]
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        yield
+        if self.enabled:
+            self.phases.append((name, time.perf_counter() - started))
 
-    print(f"Loaded Anthropic API Key: {api_key[:10]}...{api_key[-5:]}")
+    def report(self):
+        if not self.enabled:
+            return
+        lines = [f"  {name:<32} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        lines.append(f"  {'total to prompt':<32} {(time.perf_counter() - STARTED) * 1000:8.1f} ms")
+        print_colored("Startup profile:\n" + "\n".join(lines), RESULT_COLOR)
 
+def main():
     parser = argparse.ArgumentParser(description="AI Coding Assistant")
     parser.add_argument("--model", choices=["claude", "gpt4"], default="claude",
                         help="Choose the AI model (default: claude)")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Wait for complete responses instead of streaming them")
+    parser.add_argument("--fan-out", default="",
+                        help="Comma-separated models to query concurrently, keeping the first answer (e.g. claude,gpt4)")
+    parser.add_argument("--context-budget", type=int, default=60000,
+                        help="Approximate token budget for conversation history sent per request")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Replay identical requests from the on-disk response cache (also ASSISTANT_RESPONSE_CACHE=1)")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Run prompts from a JSONL file ('-' for stdin) without the interactive loop")
+    parser.add_argument("--batch-output", metavar="FILE", default="-",
+                        help="Where to write batch results as JSONL (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of batch tasks to run at once (default: 4)")
+    parser.add_argument("--batch-state-dir", metavar="DIR",
+                        help="Keep each batch task's conversation journal under DIR/<task id>")
+    parser.add_argument("--related-context", type=int, default=4000, metavar="CHARS",
+                        help="Characters of related-file summaries added to each request (0 disables)")
+    parser.add_argument("--attach", action="store_true",
+                        help="Run as a thin client of the project's background daemon, starting it if needed")
+    parser.add_argument("--session", metavar="NAME",
+                        help="Daemon session to attach to; its conversation is kept under .assistant/sessions/NAME")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run the daemon in the foreground (--attach starts it automatically)")
+    parser.add_argument("--daemon-status", action="store_true",
+                        help="Show the running daemon's sessions and exit")
+    parser.add_argument("--stop-daemon", action="store_true",
+                        help="Stop the running daemon and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report how long each startup phase took")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Append a JSONL span for every turn, model request and tool call to FILE (also ASSISTANT_TRACE)")
     args = parser.parse_args()
+    profile = StartupProfile(args.profile_startup)
+
+    if args.attach or args.daemon_status or args.stop_daemon:
+        # The thin client needs none of the assistant's modules; the daemon holds them warm
+        return run_client(args, profile)
+
+    load_dotenv()
+    if args.trace:
+        os.environ["ASSISTANT_TRACE"] = args.trace
+    fan_out_models = [name for name in args.fan_out.split(",") if name]
+    if "claude" in [args.model] + fan_out_models:
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            print_colored("Error: ANTHROPIC_API_KEY not found in environment variables.", USER_COLOR)
+            return 1
+        print(f"Loaded Anthropic API Key: {api_key[:10]}...{api_key[-5:]}")
+
+    with profile.phase("core modules"):
+        from instrumentation import configure_from_env
+        from ai_interface import AIInterface, preload_sdk
+        from context_window import ContextWindow
+        from response_cache import ResponseCache, response_cache_from_env
+        from tools import TOOLS
+    configure_from_env()
+    # Provider SDKs are slow to import; load the ones we need while the user types
+    for name in dict.fromkeys([args.model] + fan_out_models):
+        preload_sdk(name)
 
     system_prompt = """
 You are Claude, an AI assistant powered by Anthropic's Claude-3-opus-20240229 model. You are an exceptional software developer with vast knowledge across multiple programming languages, frameworks, and best practices. Your primary task is to create project structures and generate code for websites and web applications. Your capabilities include:
@@ -41,9 +116,10 @@ When asked to create a project:
 - Provide a summary of the created structure and files after completion.
 
 When asked to make edits or improvements:
+- Use the search_code and find_symbol tools to locate the relevant code before reading whole files.
 - Use the read_file tool to examine the contents of existing files.
 - Analyze the code and suggest improvements or make necessary edits.
-- Use the write_to_file tool to implement changes.
+- Implement changes with str_replace, edit_lines, batch_edit or apply_patch; only use write_to_file when rewriting most of a file.
 
 Be sure to consider the type of project (e.g., Python, JavaScript, web application) when determining the appropriate structure and files to include.
 
@@ -62,88 +138,105 @@ Answer the user's request using relevant tools (if they are available). Before c
 Always strive to create a functional and well-structured project.
 """
 
-    tools = [
-        {
-            "type": "function",
-            "name": "create_folder",
-            "description": "Create a new folder at the specified path",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path where the folder should be created"
-                    }
-                },
-                "required": ["path"]
-            }
-        },
-        {
-            "type": "function",
-            "name": "create_file",
-            "description": "Create a new file at the specified path with optional content",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path where the file should be created"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "The initial content of the file (optional)"
-                    }
-                },
-                "required": ["path"]
-            }
-        },
-        {
-            "type": "function",
-            "name": "write_to_file",
-            "description": "Write content to an existing file at the specified path",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the file to write to"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "The content to write to the file"
-                    }
-                },
-                "required": ["path", "content"]
-            }
-        },
-        {
-            "type": "function",
-            "name": "list_files",
-            "description": "List all files and directories in the specified path",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the folder to list (default: current directory)"
-                    }
-                },
-                "required": []
-            }
-        }
-    ]
+    response_cache = response_cache_from_env() or (ResponseCache() if args.response_cache else None)
+
+    if args.batch:
+        from batch import BatchRunner, run_batch
+        runner = BatchRunner(args.model, system_prompt, TOOLS, concurrency=args.concurrency,
+                             context_budget=args.context_budget, fan_out_models=fan_out_models,
+                             response_cache=response_cache, state_dir=args.batch_state_dir)
+        try:
+            summary = run_batch(args.batch, args.batch_output, runner)
+        except (OSError, ValueError) as e:
+            print_colored(f"Batch failed: {str(e)}", USER_COLOR)
+            return 1
+        print(f"Batch finished: {summary['ok']}/{summary['tasks']} succeeded in {summary['elapsed_seconds']}s, "
+              f"{summary['input_tokens']} input / {summary['output_tokens']} output tokens", file=sys.stderr)
+        return 1 if summary["error"] else 0
+
+    def make_cli(model_name, journal_dir=None, prompt=input):
+        with profile.phase("CLI modules"):
+            from cli import CLI
+            from project_state import ProjectState
+        with profile.phase("AI interface"):
+            context_provider = None
+            if args.related_context > 0:
+                from dependency_graph import RelatedContext, get_dependency_graph
+                context_provider = RelatedContext(get_dependency_graph(), max_chars=args.related_context)
+            ai_interface = AIInterface(model_name, stream=not args.no_stream,
+                                       context_window=ContextWindow(token_budget=args.context_budget),
+                                       fan_out_models=fan_out_models, response_cache=response_cache,
+                                       context_provider=context_provider)
+        with profile.phase("project state"):
+            project_state = ProjectState(journal_dir=journal_dir)
+        with profile.phase("CLI setup"):
+            return CLI(ai_interface, project_state, system_prompt, TOOLS, prompt=prompt)
+
+    if args.serve:
+        from daemon import serve, routed_input
+        from utils import state_path
+
+        def session_factory(name, model_name):
+            journal_dir = os.path.dirname(state_path("sessions", name, "base.jsonl"))
+            cli = make_cli(model_name or args.model, journal_dir=journal_dir, prompt=routed_input)
+            cli.project_state.load()  # Re-attaching to a named session resumes its conversation
+            return cli
+
+        def warm_up():
+            from code_execution import get_worker_pool
+            from file_index import get_file_index
+            get_worker_pool()
+            get_file_index().refresh()
+            if args.related_context > 0:
+                from dependency_graph import get_dependency_graph
+                get_dependency_graph().update()
+
+        return serve(session_factory, warm_up=warm_up)
 
     try:
-        ai_interface = AIInterface(args.model)
-        project_state = ProjectState()
-        cli = CLI(ai_interface, project_state, system_prompt, tools)
+        cli = make_cli(args.model)
 
         print_colored("Welcome to the AI Coding Assistant!", CLAUDE_COLOR)
         print_colored("Type '/help' for a list of commands or 'exit' to end the conversation.", CLAUDE_COLOR)
+        profile.report()
 
         cli.run()
     except Exception as e:
         print_colored(f"An error occurred: {str(e)}", USER_COLOR)
 
+def daemon_command(args):
+    """Command line that starts a daemon serving with the same options as this invocation."""
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--model", args.model,
+               "--fan-out", args.fan_out, "--context-budget", str(args.context_budget),
+               "--related-context", str(args.related_context)]
+    command += ["--no-stream"] if args.no_stream else []
+    command += ["--response-cache"] if args.response_cache else []
+    command += ["--trace", os.path.abspath(args.trace)] if args.trace else []
+    return command
+
+def run_client(args, profile):
+    from daemon import DaemonError, attach, connect
+    if args.attach:
+        try:
+            return attach(daemon_command(args), session=args.session, model=args.model, ready=profile.report)
+        except DaemonError as e:
+            print_colored(f"Daemon error: {str(e)}", USER_COLOR)
+            return 1
+    client = connect()
+    if client is None:
+        print_colored("No assistant daemon is running for this project.", RESULT_COLOR)
+        return 1
+    try:
+        if args.stop_daemon:
+            client.call("shutdown")
+            print_colored("Daemon stopping.", RESULT_COLOR)
+        else:
+            status = client.call("status")
+            print_colored(f"Daemon {status['pid']}: up {status['uptime_seconds']}s, {status['clients']} clients, "
+                          f"sessions: {', '.join(status['sessions']) or 'none'}", RESULT_COLOR)
+    finally:
+        client.close()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
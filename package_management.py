@@ -1,24 +1,248 @@
-import subprocess
+import json
+import os
 import re
-from importlib.metadata import distributions
+import site
+import subprocess
+import sys
+import threading
+import tempfile
+from importlib.metadata import packages_distributions, version, PackageNotFoundError
+from ast_analysis import analyze_source, analyze_files
+from file_index import get_file_index
+from utils import state_path, atomic_write
+
+# Import names whose distribution isn't installed yet, so the metadata can't tell us
+KNOWN_DISTRIBUTIONS = {
+    "dotenv": "python-dotenv", "yaml": "PyYAML", "PIL": "Pillow", "cv2": "opencv-python",
+    "sklearn": "scikit-learn", "bs4": "beautifulsoup4", "tavily": "tavily-python", "dateutil": "python-dateutil",
+    "jwt": "PyJWT", "magic": "python-magic", "serial": "pyserial", "usb": "pyusb", "Crypto": "pycryptodome",
+    "OpenSSL": "pyOpenSSL", "google.protobuf": "protobuf", "attr": "attrs", "docx": "python-docx",
+    "pptx": "python-pptx", "git": "GitPython", "psycopg2": "psycopg2-binary", "MySQLdb": "mysqlclient",
+    "zmq": "pyzmq", "skimage": "scikit-image", "Levenshtein": "python-Levenshtein",
+    "opentelemetry": "opentelemetry-api",
+}
+
+def normalize_name(name):
+    """PEP 503 normalized distribution name."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def site_directories():
+    directories = list(site.getsitepackages()) if hasattr(site, "getsitepackages") else []
+    user_site = site.getusersitepackages() if hasattr(site, "getusersitepackages") else None
+    directories += [user_site] if user_site else []
+    directories += [path for path in sys.path if path.endswith(("site-packages", "dist-packages"))]
+    return sorted({path for path in directories if os.path.isdir(path)})
+
+def _site_signature():
+    # Installing or removing a distribution adds or removes a *.dist-info entry, changing the mtime
+    return {path: os.stat(path).st_mtime_ns for path in site_directories()}
+
+class DistributionIndex:
+    """Maps top-level import names to installed distributions, plus the standard library's module names.
+
+    Built from importlib.metadata once, persisted under .assistant/, and rebuilt only when a
+    site-packages directory changes.
+    """
+
+    def __init__(self, persist=True):
+        self.path = state_path("distribution_index.json") if persist else None
+        self.lock = threading.Lock()
+        self.signature = None
+        self.modules = {}
+
+    def _current(self):
+        signature = _site_signature()
+        if signature == self.signature:
+            return
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                if data["signature"] == signature:
+                    self.signature, self.modules = signature, data["modules"]
+                    return
+            except (OSError, ValueError, KeyError):
+                pass
+        self.modules = {name: sorted(set(dists)) for name, dists in packages_distributions().items()}
+        self.signature = signature
+        if self.path:
+            atomic_write(self.path, json.dumps({"signature": signature, "modules": self.modules}))
+
+    def distributions_for(self, module):
+        with self.lock:
+            self._current()
+            return self.modules.get(module.split(".")[0], [])
+
+    @staticmethod
+    def is_stdlib(module):
+        top = module.split(".")[0]
+        return top in sys.stdlib_module_names or top in sys.builtin_module_names or top == "__future__"
+
+    def requirement_for(self, module):
+        """The distribution that provides module, or None for the standard library."""
+        if self.is_stdlib(module):
+            return None
+        installed = self.distributions_for(module)
+        if installed:
+            return installed[0]
+        return KNOWN_DISTRIBUTIONS.get(module) or KNOWN_DISTRIBUTIONS.get(module.split(".")[0]) or module.split(".")[0]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_distribution_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DistributionIndex()
+        return _index
 
-def update_requirements(file_content):
-    imports = re.findall(r'^import\s+(\w+)|^from\s+(\w+)', file_content, re.MULTILINE)
-    packages = set(import_name for group in imports for import_name in group if import_name)
+def _absolute_imports(analysis):
+    # Imports inside try/except ImportError are optional dependencies, not requirements
+    return {detail["module"] for detail in analysis["import_details"]
+            if detail["level"] == 0 and detail["module"] and not detail.get("guarded")}
 
-    installed_packages = {dist.metadata['Name'].lower() for dist in distributions()}
-    new_packages = packages - installed_packages
+def local_modules(root_dir="."):
+    """Top-level names importable from the project itself, which never belong in requirements."""
+    index = get_file_index(root_dir)
+    names = set()
+    for path in index.iter_files(".py"):
+        parts = path.replace(os.sep, "/").split("/")
+        names.add(parts[0][:-3] if len(parts) == 1 else parts[0])
+        if len(parts) > 1 and parts[0] in ("src", "lib"):
+            names.add(parts[1][:-3] if len(parts) == 2 else parts[1])
+    return names
+
+def scan_project_imports(root_dir="."):
+    """Absolute imports across every Python file in the project, parsed in one pass through the AST cache."""
+    index = get_file_index(root_dir)
+    index.refresh()
+    paths = [os.path.join(root_dir, path) for path in index.iter_files(".py")]
+    imports = set()
+    for analysis in analyze_files(paths).values():
+        imports |= _absolute_imports(analysis)
+    return imports
+
+def required_distributions(imports, root_dir="."):
+    index = get_distribution_index()
+    local = local_modules(root_dir)
+    required = {}
+    for module in sorted(imports):
+        if module.split(".")[0] in local:
+            continue
+        distribution = index.requirement_for(module)
+        if distribution:
+            required.setdefault(normalize_name(distribution), distribution)
+    return required
+
+def read_requirements(path="requirements.txt"):
+    """Normalized names of the requirements already listed in path."""
+    names = set()
+    if not os.path.exists(path):
+        return names
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            match = re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", line)
+            if match and not line.startswith("-"):
+                names.add(normalize_name(match.group(0)))
+    return names
+
+def update_requirements(file_content=None, root_dir=".", requirements_path="requirements.txt"):
+    """Add missing distributions to requirements.txt for one file's source, or for the whole project."""
+    if file_content is None:
+        imports = scan_project_imports(root_dir)
+    else:
+        imports = _absolute_imports(analyze_source(file_content))
+    listed = read_requirements(requirements_path)
+    new_packages = [name for key, name in required_distributions(imports, root_dir).items() if key not in listed]
 
     if new_packages:
-        with open('requirements.txt', 'a') as req_file:
-            for package in new_packages:
-                req_file.write(f"{package}\\n")
+        existing = ""
+        if os.path.exists(requirements_path):
+            with open(requirements_path, "r") as req_file:
+                existing = req_file.read()
+        if existing and not existing.endswith("\n"):
+            existing += "\n"
+        atomic_write(requirements_path, existing + "".join(f"{package}\n" for package in new_packages))
         return f"Added {', '.join(new_packages)} to requirements.txt"
     return "No new packages to add."
 
-def install_packages():
+def install_config():
+    """Install settings, overridable through ASSISTANT_* environment variables."""
+    return {"package_dir": os.getenv("ASSISTANT_PACKAGE_DIR") or None,
+            "wheel_dir": os.getenv("ASSISTANT_WHEEL_DIR") or os.path.dirname(state_path("wheels", "wheel"))}
+
+_WHEEL_NAME = re.compile(r"^(?P<name>[^-]+)-(?P<version>[^-]+)(-\d[^-]*)?-[^-]+-[^-]+-[^-]+\.whl$")
+
+def _pip(*args):
+    return subprocess.run([sys.executable, "-m", "pip", *args], capture_output=True, text=True)
+
+def _cached_wheels(wheel_dir):
+    """(normalized name, normalized version) -> wheel path for every wheel in the cache directory."""
+    wheels = {}
+    for entry in os.listdir(wheel_dir):
+        match = _WHEEL_NAME.match(entry)
+        if match:
+            key = (normalize_name(match.group("name")), normalize_name(match.group("version")))
+            wheels[key] = os.path.join(wheel_dir, entry)
+    return wheels
+
+def _needs_install(name, wanted):
     try:
-        subprocess.run(["pip", "install", "-r", "requirements.txt"], check=True)
-        return "Packages installed successfully."
-    except subprocess.CalledProcessError as e:
-        return f"Error installing packages: {str(e)}"
\ No newline at end of file
+        return normalize_name(version(name)) != wanted
+    except PackageNotFoundError:
+        return True
+
+def _resolve(requirements_path, sources):
+    """The pinned (name, version) set pip resolves for the requirements, without installing anything."""
+    with tempfile.TemporaryDirectory() as scratch:
+        report_path = os.path.join(scratch, "report.json")
+        resolved = _pip("install", "--dry-run", "--ignore-installed", "--quiet", "--report", report_path,
+                        "-r", requirements_path, *sources)
+        if resolved.returncode != 0:
+            raise RuntimeError(resolved.stderr.strip() or resolved.stdout.strip())
+        with open(report_path, "r") as f:
+            report = json.load(f)
+    return [(item["metadata"]["name"], item["metadata"]["version"]) for item in report.get("install", [])]
+
+def install_packages(requirements_path="requirements.txt", package_dir=None):
+    """Resolve requirements once into a local wheel cache, then install the missing wheels in one pip run.
+
+    pip resolves the whole requirement set a single time and reports the pinned versions; any
+    of those not yet in the wheel cache are built into it, and the ones not already installed
+    at that version go to a single `pip install --no-index` against the cache. With
+    package_dir (or ASSISTANT_PACKAGE_DIR) everything comes from that directory and no
+    network is used.
+    """
+    config = install_config()
+    package_dir = package_dir or config["package_dir"]
+    wheel_dir = config["wheel_dir"]
+    os.makedirs(wheel_dir, exist_ok=True)
+
+    sources = ["--find-links", wheel_dir] + (["--no-index", "--find-links", package_dir] if package_dir else [])
+    try:
+        pinned = _resolve(requirements_path, sources)
+    except (RuntimeError, OSError, ValueError, KeyError) as e:
+        return f"Error resolving packages: {e}"
+    if not pinned:
+        return "No packages to install."
+
+    keys = {(normalize_name(name), normalize_name(wanted)): f"{name}=={wanted}" for name, wanted in pinned}
+    missing = [spec for key, spec in keys.items() if key not in _cached_wheels(wheel_dir)]
+    if missing:
+        built = _pip("wheel", "--no-deps", "-w", wheel_dir, *sources, *missing)
+        if built.returncode != 0:
+            return f"Error building wheels: {built.stderr.strip() or built.stdout.strip()}"
+    cached = _cached_wheels(wheel_dir)
+    unavailable = [spec for key, spec in keys.items() if key not in cached]
+    if unavailable:
+        return f"Error: no wheels found in {wheel_dir} for {', '.join(unavailable)}"
+
+    pending = [cached[key] for key in keys if _needs_install(*key)]
+    if not pending:
+        return "All packages are already installed."
+    installed = _pip("install", "--quiet", "--no-index", "--find-links", wheel_dir, *pending)
+    if installed.returncode != 0:
+        return f"Error installing packages: {installed.stderr.strip() or installed.stdout.strip()}"
+    return f"Installed {len(pending)} packages ({len(keys) - len(pending)} already up to date)."
@@ -2,43 +2,105 @@ import json
 import os
 import threading
 import time
-from context_analysis import analyze_project_structure
+from file_index import get_file_index
+from instrumentation import span
+from journal import ConversationJournal
+
+# Whole-file state written by older versions; imported into the journal on first load
+LEGACY_STATE_FILE = "project_state.json"
 
 class ProjectState:
-    def __init__(self, save_interval=300):
+    def __init__(self, save_interval=300, persist=True, journal_dir=None, migrate_legacy=None):
+        # persist=False keeps history in memory only, for independent batch tasks
         self.conversation_history = []
-        self.file_structure = self.get_file_structure()
+        # Only the project's default journal takes over the legacy history; session and batch
+        # journals start empty
+        self.migrate_legacy = journal_dir is None if migrate_legacy is None else migrate_legacy
+        self.saved_count = 0
+        self.save_lock = threading.Lock()
+        self.journal = ConversationJournal(journal_dir) if persist else None
+        self.file_index = None
+        self._file_structure = {}
+        # The initial scan runs in the background; file_structure waits for it on first access
+        self.scan_ready = threading.Event()
+        threading.Thread(target=self._initial_scan, daemon=True).start()
         self.save_interval = save_interval
         self.last_save_time = time.time()
-        self.start_auto_save()
+        self.closed = threading.Event()
+        if self.journal:
+            self.start_auto_save()
 
     def add_to_history(self, message):
         if message.get('content'):  # Only add non-empty messages
             self.conversation_history.append(message)
             self.check_auto_save()
 
+    def _initial_scan(self):
+        try:
+            self.file_index = get_file_index()
+            self.file_index.refresh()
+            self._file_structure = self.file_index.structure
+        finally:
+            self.scan_ready.set()
+
+    @property
+    def file_structure(self):
+        self.scan_ready.wait()
+        return self._file_structure
+
+    @file_structure.setter
+    def file_structure(self, structure):
+        self._file_structure = structure
+
     def update_file_structure(self):
         self.file_structure = self.get_file_structure()
         self.check_auto_save()
 
     def get_file_structure(self):
-        return analyze_project_structure()
+        self.scan_ready.wait()
+        if self.file_index is None:
+            self.file_index = get_file_index()
+        with span("file_index.refresh") as refresh:
+            changes = self.file_index.refresh()
+            refresh.set(added=len(changes["added"]), removed=len(changes["removed"]))
+        return self.file_index.structure
 
     def save(self):
-        state = {
-            "conversation_history": self.conversation_history,
-            "file_structure": self.file_structure
-        }
-        with open("project_state.json", "w") as f:
-            json.dump(state, f)
-        self.last_save_time = time.time()
+        # Only messages added since the last save are appended to the journal
+        if self.journal is None:
+            return
+        with self.save_lock, span("state.save") as save:
+            new_messages = self.conversation_history[self.saved_count:]
+            save.set(messages=len(new_messages))
+            # Always an append: a session that never loaded the journal adds to it rather than
+            # replacing history it hasn't seen
+            self.journal.append(new_messages)
+            self.saved_count += len(new_messages)
+            self.last_save_time = time.time()
+
+    def load(self, max_messages=None):
+        """Load history from the journal, optionally only the most recent max_messages."""
+        if self.journal is None:
+            return
+        with self.save_lock:
+            if self.migrate_legacy and self.journal.is_empty() and os.path.exists(LEGACY_STATE_FILE):
+                with open(LEGACY_STATE_FILE, "r") as f:
+                    state = json.load(f)
+                self.journal.rewrite(state.get("conversation_history", []))
+            if max_messages is None:
+                self.conversation_history = list(self.journal.iter_messages())
+            else:
+                self.conversation_history = self.journal.tail(max_messages)
+            self.saved_count = len(self.conversation_history)
+        self.file_structure = self.get_file_structure()
 
-    def load(self):
-        if os.path.exists("project_state.json"):
-            with open("project_state.json", "r") as f:
-                state = json.load(f)
-            self.conversation_history = state["conversation_history"]
-            self.file_structure = state["file_structure"]
+    def older_history(self, count):
+        """Page in up to count saved messages that precede the loaded history."""
+        if self.journal is None:
+            return []
+        total = self.journal.count()
+        end = max(total - self.saved_count, 0)
+        return self.journal.page(max(end - count, 0), end)
 
     def check_auto_save(self):
         if time.time() - self.last_save_time >= self.save_interval:
@@ -46,8 +108,12 @@ class ProjectState:
 
     def start_auto_save(self):
         def auto_save():
-            while True:
-                time.sleep(self.save_interval)
+            while not self.closed.wait(self.save_interval):
                 self.save()
 
-        threading.Thread(target=auto_save, daemon=True).start()
\ No newline at end of file
+        threading.Thread(target=auto_save, daemon=True).start()
+
+    def close(self):
+        """Save once more and stop auto-saving; used when a daemon session ends."""
+        self.closed.set()
+        self.save()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+from tools import MUTATING_TOOLS
+from utils import state_path, atomic_write
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_MB = 100
+# Eviction trims to this fraction of the limits, so the directory is rescanned only every so many puts
+EVICT_TO = 0.9
+
+def request_key(model_id, messages, system_prompt, tools):
+    """Content address of a request: a hash of its canonical JSON form."""
+    canonical = json.dumps({"model": model_id, "system": system_prompt, "tools": tools, "messages": messages},
+                           sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _to_plain(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, SimpleNamespace):
+        return {key: _to_plain(item) for key, item in vars(value).items()}
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(item) for item in value]
+    return value
+
+def serialize_response(response):
+    return _to_plain(response)
+
+def deserialize_response(data):
+    """Rebuild a response with the attribute access the chat loop expects; tool inputs stay dicts."""
+    content = [SimpleNamespace(**block) for block in data.get("content", [])]
+    # Replayed responses cost nothing, so they report no token usage
+    usage = SimpleNamespace(**{key: 0 for key in (data.get("usage") or {})})
+    return SimpleNamespace(**dict(data, content=content, usage=usage, cached=True))
+
+def is_replay_safe(response):
+    """A response asking for tools with side effects must reach the model again, never a replay."""
+    return not any(getattr(block, "type", None) == "tool_use" and block.name in MUTATING_TOOLS
+                   for block in response.content)
+
+class ResponseCache:
+    """On-disk cache of model responses, one file per request hash.
+
+    File mtimes record last use, so eviction is least-recently-used once the cache
+    exceeds max_entries files or max_bytes in total. Puts keep a running count and size, and
+    only crossing a limit rescans the directory.
+    """
+
+    def __init__(self, directory=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory or os.path.dirname(state_path("responses", "entry"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evicted": 0}
+        self.entries = None      # Estimated file count and total bytes, from the last scan plus puts since
+        self.total_bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+        return deserialize_response(data)
+
+    def put(self, key, response):
+        if not is_replay_safe(response):
+            with self.lock:
+                self.stats["bypassed"] += 1
+            return False
+        content = json.dumps(serialize_response(response))
+        atomic_write(self._path(key), content)
+        with self.lock:
+            if self.entries is not None:
+                self.entries += 1
+                self.total_bytes += len(content.encode("utf-8"))
+            if self.entries is None or self.entries > self.max_entries or self.total_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def _evict(self):
+        """Rescan the directory; if it is over a limit, remove least recently used files down to EVICT_TO of it."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        scale = EVICT_TO if len(entries) > self.max_entries or total > self.max_bytes else 1
+        while entries and (len(entries) > self.max_entries * scale or total > self.max_bytes * scale):
+            _, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats["evicted"] += 1
+        self.entries, self.total_bytes = len(entries), total
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return (f"Response cache: {self.stats['hits']}/{lookups} hits ({self.hit_rate():.0%}), "
+                f"{self.stats['bypassed']} not cached due to side effects")
+
+def response_cache_from_env():
+    """A ResponseCache if ASSISTANT_RESPONSE_CACHE is set, sized by ASSISTANT_RESPONSE_CACHE_MB/_ENTRIES."""
+    if os.getenv("ASSISTANT_RESPONSE_CACHE", "").lower() not in ("1", "true", "yes", "on"):
+        return None
+    try:
+        max_mb = float(os.getenv("ASSISTANT_RESPONSE_CACHE_MB", DEFAULT_MAX_MB))
+        max_entries = int(os.getenv("ASSISTANT_RESPONSE_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES))
+    except ValueError:
+        max_mb, max_entries = DEFAULT_MAX_MB, DEFAULT_MAX_ENTRIES
+    return ResponseCache(max_entries=max_entries, max_bytes=int(max_mb * 1024 * 1024))
@@ -0,0 +1,395 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import span, add
+from code_index import search_code, find_symbol
+from web_search import tavily_search
+from checks import run_checks, CHECK_NAMES
+from file_operations import (create_folder, create_file, write_to_file, read_file, list_files,
+                             str_replace, edit_lines, batch_edit, apply_patch)
+
+# Tool definitions in the Anthropic tool-use format
+TOOLS = [
+    {
+        "name": "create_folder",
+        "description": "Create a new folder at the specified path",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path where the folder should be created"
+                }
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "create_file",
+        "description": "Create a new file at the specified path with optional content",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path where the file should be created"
+                },
+                "content": {
+                    "type": "string",
+                    "description": "The initial content of the file (optional)"
+                }
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "write_to_file",
+        "description": "Write content to an existing file at the specified path",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to write to"
+                },
+                "content": {
+                    "type": "string",
+                    "description": "The content to write to the file"
+                }
+            },
+            "required": ["path", "content"]
+        }
+    },
+    {
+        "name": "str_replace",
+        "description": "Replace an exact, unique snippet of text in an existing file. Much cheaper than rewriting the whole file.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to edit"
+                },
+                "old": {
+                    "type": "string",
+                    "description": "The exact text to replace; must match exactly once unless replace_all is set"
+                },
+                "new": {
+                    "type": "string",
+                    "description": "The replacement text"
+                },
+                "replace_all": {
+                    "type": "boolean",
+                    "description": "Replace every occurrence instead of requiring a unique match (optional)"
+                }
+            },
+            "required": ["path", "old", "new"]
+        }
+    },
+    {
+        "name": "edit_lines",
+        "description": "Replace a range of lines in an existing file (1-based, inclusive). Use end_line = start_line - 1 to insert before start_line.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to edit"
+                },
+                "start_line": {
+                    "type": "integer",
+                    "description": "First line to replace"
+                },
+                "end_line": {
+                    "type": "integer",
+                    "description": "Last line to replace"
+                },
+                "content": {
+                    "type": "string",
+                    "description": "The new lines; empty to delete the range"
+                }
+            },
+            "required": ["path", "start_line", "end_line", "content"]
+        }
+    },
+    {
+        "name": "batch_edit",
+        "description": "Apply several edits across one or more files in one call. Each edit is either a str_replace (path, old, new) or a line edit (path, start_line, end_line, content). Nothing is written unless every edit applies.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "edits": {
+                    "type": "array",
+                    "description": "The edits to apply, in order",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "path": {"type": "string"},
+                            "old": {"type": "string"},
+                            "new": {"type": "string"},
+                            "replace_all": {"type": "boolean"},
+                            "start_line": {"type": "integer"},
+                            "end_line": {"type": "integer"},
+                            "content": {"type": "string"}
+                        },
+                        "required": ["path"]
+                    }
+                }
+            },
+            "required": ["edits"]
+        }
+    },
+    {
+        "name": "apply_patch",
+        "description": "Apply a unified diff (---/+++ headers and @@ hunks) that may touch several files, including creating (/dev/null source) and deleting files. Nothing is written unless every hunk applies.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "patch": {
+                    "type": "string",
+                    "description": "The unified diff to apply"
+                }
+            },
+            "required": ["patch"]
+        }
+    },
+    {
+        "name": "read_file",
+        "description": "Read the contents of a file at the specified path. Large files are truncated, so read them in parts with a line range, head/tail, a byte range, or grep for a pattern.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to read"
+                },
+                "start_line": {
+                    "type": "integer",
+                    "description": "First line to read, 1-based (optional)"
+                },
+                "end_line": {
+                    "type": "integer",
+                    "description": "Last line to read, inclusive (optional)"
+                },
+                "head": {
+                    "type": "integer",
+                    "description": "Read only the first N lines (optional)"
+                },
+                "tail": {
+                    "type": "integer",
+                    "description": "Read only the last N lines (optional)"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Byte offset to start reading at (optional)"
+                },
+                "length": {
+                    "type": "integer",
+                    "description": "Number of bytes to read from offset (optional)"
+                },
+                "grep": {
+                    "type": "string",
+                    "description": "Regular expression; return only matching lines with their line numbers (optional)"
+                },
+                "context": {
+                    "type": "integer",
+                    "description": "Lines of context around each grep match (default: 0)"
+                }
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "search_code",
+        "description": "Search the project's source files and return the most relevant snippets with file paths and line numbers. Prefer this over reading whole files when looking for where something is implemented.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Keywords or identifiers to search for"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of snippets to return (default: 5)"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "find_symbol",
+        "description": "Find where a function, class or method is defined in the project's Python files",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "The symbol name, optionally qualified (e.g. ClassName.method)"
+                }
+            },
+            "required": ["name"]
+        }
+    },
+    {
+        "name": "tavily_search",
+        "description": "Search the web for current information. Returns a concise answer along with relevant sources.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The search query"
+                },
+                "search_depth": {
+                    "type": "string",
+                    "enum": ["basic", "advanced"],
+                    "description": "How thorough the search should be (default: basic)"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of sources to return (default: 5)"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "run_checks",
+        "description": "Run the project's tests (pytest, sharded across cores), linters and type checkers in parallel. "
+                       "Returns a compact summary of failures; use only_failed to re-run just the tests that failed last time.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "checks": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(CHECK_NAMES)},
+                    "description": "Checks to run (default: every check that applies to the project)"
+                },
+                "paths": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Test files or node ids for pytest, and paths for linters (default: whole project)"
+                },
+                "only_failed": {
+                    "type": "boolean",
+                    "description": "Re-run only the tests that failed in the previous run"
+                }
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "list_files",
+        "description": "List all files and directories in the specified path",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the folder to list (default: current directory)"
+                }
+            },
+            "required": []
+        }
+    }
+]
+
+READ_FILE_OPTIONS = ("start_line", "end_line", "head", "tail", "offset", "length", "grep", "context")
+
+TOOL_HANDLERS = {
+    "create_folder": lambda args: create_folder(args["path"]),
+    "create_file": lambda args: create_file(args["path"], args.get("content", "")),
+    "write_to_file": lambda args: write_to_file(args["path"], args["content"]),
+    "str_replace": lambda args: str_replace(args["path"], args["old"], args["new"], args.get("replace_all", False)),
+    "edit_lines": lambda args: edit_lines(args["path"], args["start_line"], args["end_line"], args["content"]),
+    "batch_edit": lambda args: batch_edit(args["edits"]),
+    "apply_patch": lambda args: apply_patch(args["patch"]),
+    "read_file": lambda args: read_file(args["path"], **{key: args[key] for key in READ_FILE_OPTIONS if key in args}),
+    "search_code": lambda args: search_code(args["query"], args.get("limit", 5)),
+    "find_symbol": lambda args: find_symbol(args["name"]),
+    "tavily_search": lambda args: tavily_search(args["query"], args.get("search_depth", "basic"),
+                                                args.get("max_results", 5)),
+    "list_files": lambda args: list_files(args.get("path", ".")),
+    "run_checks": lambda args: run_checks(args.get("checks"), args.get("paths"), args.get("only_failed", False)),
+}
+
+# Tools that change the filesystem
+MUTATING_TOOLS = {"create_folder", "create_file", "write_to_file", "str_replace", "edit_lines",
+                  "batch_edit", "apply_patch"}
+# Mutating tools whose targets aren't given by a single "path" argument; they never run alongside other writes
+MULTI_PATH_TOOLS = {"batch_edit", "apply_patch"}
+
+MAX_TOOL_WORKERS = 8
+
+def execute_tool(tool_name, tool_arguments):
+    handler = TOOL_HANDLERS.get(tool_name)
+    if handler is None:
+        return f"Unknown tool: {tool_name}"
+    return handler(tool_arguments)
+
+def _run_group(calls):
+    results = []
+    for call_id, name, arguments in calls:
+        path = arguments.get("path") if isinstance(arguments, dict) else None
+        with span("tool." + name, path=path) as tool_span:
+            try:
+                results.append((call_id, str(execute_tool(name, arguments)), False))
+            except Exception as e:
+                results.append((call_id, f"Error running {name}: {str(e)}", True))
+            tool_span.set(result_chars=len(results[-1][1]), is_error=results[-1][2])
+        add("tool_calls", 1)
+    return results
+
+def _target(call):
+    path = call[2].get("path") if isinstance(call[2], dict) else None
+    return os.path.abspath(path) if path is not None and call[1] not in MULTI_PATH_TOOLS else None
+
+def _related(a, b):
+    """Whether two paths are the same or one contains the other."""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+def _write_groups(calls):
+    """Split consecutive mutating calls into groups that can run concurrently.
+
+    Calls on the same path or on a folder and something inside it share a group and keep their
+    order; a call without a single target path (batch_edit, apply_patch) makes the whole phase serial.
+    """
+    if any(_target(call) is None for call in calls):
+        return [calls]
+    groups = []
+    for call in calls:
+        related = [group for group in groups if any(_related(_target(call), _target(other)) for other in group)]
+        merged = [other for group in related for other in group] + [call]
+        groups = [group for group in groups if group not in related]
+        groups.append(sorted(merged, key=calls.index))
+    return groups
+
+def _run_concurrently(groups):
+    if len(groups) <= 1:
+        return [result for group in groups for result in _run_group(group)]
+    # Each group runs in a copy of this context so its tool spans nest under the current turn
+    with ThreadPoolExecutor(max_workers=min(MAX_TOOL_WORKERS, len(groups))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _run_group, group) for group in groups]
+        return [result for future in futures for result in future.result()]
+
+def run_tool_calls(calls):
+    """Run (id, name, arguments) tool calls and return (id, result, is_error) in call order.
+
+    Calls run in phases that follow the response order: a run of consecutive read-only calls
+    executes concurrently, and a run of consecutive mutating calls executes as concurrent groups
+    of unrelated paths (see _write_groups). Reads therefore never overlap writes, and a write
+    never overlaps another write to the same file or folder tree.
+    """
+    phases = []
+    for call in calls:
+        mutating = call[1] in MUTATING_TOOLS
+        if phases and phases[-1][0] == mutating:
+            phases[-1][1].append(call)
+        else:
+            phases.append((mutating, [call]))
+    results = []
+    for mutating, phase in phases:
+        results += _run_concurrently(_write_groups(phase) if mutating else [[call] for call in phase])
+    order = {call[0]: index for index, call in enumerate(calls)}
+    return sorted(results, key=lambda result: order[result[0]])
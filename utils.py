@@ -1,3 +1,6 @@
+import os
+import shutil
+import threading
 from colorama import init, Fore, Style
 
 # Initialize colorama
@@ -10,10 +13,37 @@ GPT_COLOR = Fore.GREEN
 TOOL_COLOR = Fore.YELLOW
 RESULT_COLOR = Fore.CYAN
 
-def print_colored(text, color):
-    print(f"{color}{text}{Style.RESET_ALL}")
+# Directory for indexes, caches and other local assistant state
+STATE_DIR = ".assistant"
+
+def print_colored(text, color, end="\n"):
+    print(f"{color}{text}{Style.RESET_ALL}", end=end, flush=True)
 
 def format_code(code, language):
     # Implement code formatting logic here if needed
     # For now, we'll just return the code as is
-    return code
\ No newline at end of file
+    return code
+
+def state_path(*parts, root="."):
+    directory = os.path.join(root, STATE_DIR, *parts[:-1])
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, parts[-1])
+
+def atomic_write(path, content, mode="w", fsync=True):
+    """Write content to a temp file next to path and rename it into place.
+
+    A symlink is followed so the link stays and its target is updated, and an existing file
+    keeps its permission bits. fsync=False skips flushing to disk, for caches that can be
+    rebuilt if a crash loses them.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, mode) as f:
+        f.write(content)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    if os.path.exists(path):
+        shutil.copymode(path, temp_path)
+    os.replace(temp_path, path)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from api_client import get_tavily_client
+from instrumentation import add
+from utils import state_path, atomic_write
+
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+MAX_CACHE_ENTRIES = 1000
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def search_config():
+    """Search settings, overridable through ASSISTANT_SEARCH_* environment variables."""
+    try:
+        ttl = float(os.getenv("ASSISTANT_SEARCH_TTL", DEFAULT_TTL_SECONDS))
+    except ValueError:
+        ttl = DEFAULT_TTL_SECONDS
+    return {"backend": os.getenv("ASSISTANT_SEARCH_BACKEND", "tavily"), "ttl": ttl,
+            "fixtures": os.getenv("ASSISTANT_SEARCH_FIXTURES")}
+
+class TavilyBackend:
+    def search(self, query, search_depth, max_results):
+        return get_tavily_client().search(query, search_depth=search_depth, max_results=max_results,
+                                          include_answer=True)
+
+class LocalBackend:
+    """Offline stand-in for Tavily: answers from a JSON fixtures file, or a canned result.
+
+    The fixtures file maps normalized queries to Tavily-shaped responses
+    ({"answer": ..., "results": [{"title", "url", "content"}]}).
+    """
+
+    def __init__(self, fixtures_path=None):
+        self.fixtures = {}
+        self.calls = 0
+        if fixtures_path:
+            with open(fixtures_path, "r") as f:
+                self.fixtures = {normalize_query(query): result for query, result in json.load(f).items()}
+
+    def search(self, query, search_depth, max_results):
+        self.calls += 1
+        result = self.fixtures.get(normalize_query(query))
+        if result is None:
+            result = {"answer": f"No local results for: {query}",
+                      "results": [{"title": query, "url": "http://localhost/search?q=" + "+".join(query.split()),
+                                   "content": ""}]}
+        return {"answer": result.get("answer"), "results": result.get("results", [])[:max_results]}
+
+class SearchCache:
+    """Search responses keyed by normalized query and options, expiring after ttl seconds."""
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, persist=True):
+        self.ttl = ttl
+        self.path = state_path("search_cache.json") if persist else None
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["time"] > self.ttl:
+                del self.entries[key]
+                return None
+            return entry["result"]
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = {"time": time.time(), "result": result}
+            now = time.time()
+            self.entries = {k: v for k, v in self.entries.items() if now - v["time"] <= self.ttl}
+            if len(self.entries) > MAX_CACHE_ENTRIES:
+                newest = sorted(self.entries.items(), key=lambda item: item[1]["time"])[-MAX_CACHE_ENTRIES:]
+                self.entries = dict(newest)
+            if self.path:
+                atomic_write(self.path, json.dumps(self.entries))
+
+class WebSearch:
+    """Cached web search; identical queries in flight at the same time share one backend call."""
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    @staticmethod
+    def cache_key(query, search_depth, max_results):
+        raw = json.dumps([normalize_query(query), search_depth, max_results])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def search(self, query, search_depth="basic", max_results=5):
+        key = self.cache_key(query, search_depth, max_results)
+        result = self.cache.get(key)
+        if result is not None:
+            self.stats["hits"] += 1
+            add("search_cache_hits", 1)
+            return result
+        with self.lock:
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = self.pending[key] = Future()
+        if not owner:
+            self.stats["shared"] += 1
+            return future.result()
+        self.stats["misses"] += 1
+        try:
+            result = self.backend.search(query, search_depth, max_results)
+            self.cache.put(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            # Failures are passed to waiting callers but never cached
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+def format_results(query, result):
+    lines = [f"Search results for: {query}"]
+    if result.get("answer"):
+        lines.append(f"Answer: {result['answer']}")
+    for index, item in enumerate(result.get("results", []), 1):
+        lines.append(f"{index}. {item.get('title', '')} - {item.get('url', '')}")
+        content = (item.get("content") or "").strip()
+        if content:
+            lines.append(f"   {content[:500]}")
+    return "\n".join(lines)
+
+_search = None
+_search_lock = threading.Lock()
+
+def get_web_search():
+    global _search
+    with _search_lock:
+        if _search is None:
+            config = search_config()
+            backend = LocalBackend(config["fixtures"]) if config["backend"] == "local" else TavilyBackend()
+            _search = WebSearch(backend, SearchCache(config["ttl"]))
+        return _search
+
+def tavily_search(query, search_depth="basic", max_results=5):
+    """Tool entry point: a concise answer plus sources for a web search."""
+    try:
+        return format_results(query, get_web_search().search(query, search_depth, max_results))
+    except Exception as e:
+        return f"Error performing search: {str(e)}"